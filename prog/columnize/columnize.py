@@ -12,6 +12,7 @@ statement.
 #
 
 import os
+from itertools import chain, islice
 
 def Columnize(seq, **kw):
     '''Returns a list of strings with the elements of the sequence seq
@@ -40,6 +41,12 @@ def Columnize(seq, **kw):
 
     indent [None]   If defined, then it is a string to prepend to each
                     line.
+
+    pack    [False] If True, each column is only as wide as its
+                    longest string and the most columns that fit into
+                    width are used, like the ls command.  col_width,
+                    columns and trunc are ignored.  If the longest
+                    string doesn't fit into width, one column is used.
  
     sep     [" "]   String to use to separate columns.
  
@@ -75,15 +82,14 @@ def Columnize(seq, **kw):
     the gap is (rows*columns - n).  Then we need to account for the
     number of numbers to print in each column; the vector for this is
     [3, 3, 3, 3, 2, 2, 2] (see the code for how it's constructed).
-    Finally, in the iteration loop, we need to use a correction factor
-    for when we append the empty string for the gap rather than a
-    sequence element.
+    The row strings are built directly from the column that each item
+    is in and its offset in that column.
     '''
     if not seq:
         return [""]
     # Check keywords
     allowed = set(("align", "col_width", "columns", "horiz", "ignore", 
-        "indent", "sep", "to_string", "trunc", "width",))
+        "indent", "pack", "sep", "to_string", "trunc", "width",))
     for k in kw:
         if k not in allowed:
             raise ValueError("'%s' is unknown keyword" % k)
@@ -96,6 +102,7 @@ def Columnize(seq, **kw):
     if ignore:
         return [str(i) for i in seq]
     indent    = kw.setdefault("indent", None)
+    pack      = kw.setdefault("pack", False)
     sep       = kw.setdefault("sep", " ")
     to_string = kw.setdefault("to_string", False)
     trunc     = kw.setdefault("trunc", False)
@@ -108,6 +115,9 @@ def Columnize(seq, **kw):
     align = d[align]
     # Turn seq into a sequence of strings
     sseq = [str(i) for i in seq]
+    if pack:
+        s = _Pack(sseq, width, horiz, indent, sep, align)
+        return "\n".join(s) if to_string else s
     n, maxlen, lsep = len(sseq), max([len(i) for i in sseq]), len(sep)
     # Pick reasonable defaults if width and columns not given
     if not width :
@@ -182,38 +192,23 @@ def Columnize(seq, **kw):
         if srow:
             s.append(sep.join(srow))
     else:
-        # Construct each column.  We use a correction to account for
-        # columns that don't require the full number of rows; this
-        # ensures that we iterate over all items in sseq.
-        cols, correction = [], 0
-        for col in range(columns):
-            scol = []  # Start a new column
-            for row in range(rows):
-                # Get index into sseq
-                i = col*rows + row
-                if i > n - 1 + correction or row >= num_in_column[col]:
-                    item = ""
-                    correction += 1
+        # start[col] is the index in sseq of the first item in column
+        # col.
+        start, I = [0]*columns, indent if indent is not None else ""
+        for col in range(1, columns):
+            start[col] = start[col - 1] + num_in_column[col - 1]
+        for row in range(rows):
+            srow = []
+            for col in range(columns):
+                if row < num_in_column[col]:
+                    item = fmt.format(sseq[start[col] + row])
                 else:
-                    item = sseq[i - correction]
-                item = fmt.format(item)
+                    item = fmt.format("")
                 if not trunc and len(item) > col_width:
                     msg = "'%s' too long for formatting" % item
                     raise ValueError(msg)
-                scol.append(item[:col_width] if trunc else item)
-            cols.append(scol)
-        # Get transpose of the just-constructed matrix
-        mat = []
-        for i in range(rows):
-            mat.append([""]*columns)
-        for col in range(columns):
-            for row in range(rows):
-                mat[row][col] = cols[col][row]
-        # Now build an array of the row strings
-        s = []
-        I = indent if indent is not None else ""
-        for i in mat:
-            s.append(I + sep.join(i))
+                srow.append(item[:col_width] if trunc else item)
+            s.append(I + sep.join(srow))
     # Remove trailing spaces
     for i, x in enumerate(s):
         s[i] = x.rstrip()
@@ -221,6 +216,142 @@ def Columnize(seq, **kw):
         s = "\n".join(s)
     return s
 
+def _Pack(sseq, width, horiz, indent, sep, align):
+    '''Return the list of row strings for Columnize's pack keyword.
+    sseq is the list of strings and align is "<", ">", or "^".  Columns
+    are filled top to bottom like ls (or left to right if horiz is
+    True).
+
+    The number of columns can't be more than width divided by the
+    shortest string's length plus the separator's length, so we try
+    each number of columns from there down and use the first that fits.
+    This finds the most columns even though fewer columns don't always
+    make a narrower layout (which rules out a binary search).
+    '''
+    if not width:
+        width = 79
+        if "COLUMNS" in os.environ:
+            width = int(os.environ["COLUMNS"]) - 1
+    I = indent if indent is not None else ""
+    width -= len(I)
+    n, lsep = len(sseq), len(sep)
+    lengths = [len(i) for i in sseq]
+    def Layout(columns):
+        '''Return (rows, widths) for the layout with columns columns
+        or None if it won't fit into width.  widths is the list of the
+        column widths; with top to bottom filling, there can be fewer
+        columns than asked for.  The maxima are gotten from slices of
+        lengths, which is fast because the scanning is done in C; we
+        stop as soon as the columns are too wide.
+        '''
+        rows = (n + columns - 1)//columns
+        if not horiz:
+            columns = (n + rows - 1)//rows
+        widths, total = [], -lsep
+        for col in range(columns):
+            if horiz:
+                w = max(lengths[col::columns])
+            else:
+                w = max(lengths[col*rows:(col + 1)*rows])
+            total += w + lsep
+            if total > width:
+                return None
+            widths.append(w)
+        return rows, widths
+    most = min(n, (width + lsep)//max(min(lengths) + lsep, 1))
+    for columns in range(max(most, 1), 0, -1):
+        layout = Layout(columns)
+        if layout is not None:
+            rows, widths = layout
+            break
+    else:
+        rows, widths = n, [max(lengths)]    # Doesn't fit
+    columns = len(widths)
+    fmt = ["{0:" + align + str(w) + "}" for w in widths]
+    s = []
+    for row in range(rows):
+        if horiz:
+            items = sseq[row*columns:(row + 1)*columns]
+        else:
+            items = sseq[row::rows]
+        s.append((I + sep.join([f.format(i) for f, i in
+                                zip(fmt, items)])).rstrip())
+    return s
+
+def ColumnizeStream(iterable, **kw):
+    '''Generator that yields the row strings for the items of
+    iterable, which can be too long to hold in memory.  The output
+    starts as soon as the first row's items are read.  The keywords
+    are the same as Columnize's (pack, to_string and trunc aren't
+    used) plus:
+
+    rows [0]        If nonzero, the items are listed top-to-bottom in
+                    blocks of this many rows; each block is formatted
+                    like Columnize does.  If zero, the items are listed
+                    left-to-right and horiz is ignored.
+
+    sample [1000]   If col_width isn't given, the column width is the
+                    length of the longest of this many items at the
+                    start of iterable.
+
+    Strings longer than the column width are always truncated.
+    '''
+    allowed = set(("align", "col_width", "columns", "horiz", "ignore",
+        "indent", "rows", "sample", "sep", "width",))
+    for k in kw:
+        if k not in allowed:
+            raise ValueError("'%s' is unknown keyword" % k)
+    items = (str(i) for i in iterable)
+    if kw.get("ignore", False):
+        for item in items:
+            yield item
+        return
+    align     = kw.get("align", "left")
+    col_width = abs(int(kw.get("col_width", 0)))
+    columns   = abs(int(kw.get("columns", 0)))
+    indent    = kw.get("indent", None)
+    rows      = abs(int(kw.get("rows", 0)))
+    sample    = abs(int(kw.get("sample", 1000)))
+    sep       = kw.get("sep", " ")
+    width     = abs(int(kw.get("width", 0)))
+    d = {"left":"<", "right":">", "center":"^", "<":"<", ">":">", "^":"^"}
+    if align not in d:
+        raise ValueError("align must be left, right, center, <, >, or ^")
+    first = list(islice(items, max(sample, 1)))
+    if not first:
+        return
+    items = chain(first, items)
+    if not col_width:
+        col_width = max(1, max([len(i) for i in first]))
+    if not columns:
+        if not width:
+            width = 79
+            if "COLUMNS" in os.environ:
+                width = int(os.environ["COLUMNS"]) - 1
+        if indent is not None:
+            width -= len(indent)
+        columns = max(1, (width + len(sep))//(col_width + len(sep)))
+    I = indent if indent is not None else ""
+    if rows:
+        # Vertical blocks of rows rows.  The indent is added here, as
+        # Columnize would take it out of a width sized for columns.
+        kw = {"align": align, "col_width": col_width, "columns": columns,
+              "sep": sep, "trunc": True}
+        while True:
+            block = list(islice(items, rows*columns))
+            if not block:
+                break
+            for row in Columnize(block, **kw):
+                yield (I + row).rstrip()
+    else:
+        fmt = "{0:" + d[align] + str(col_width) + "}"
+        while True:
+            row = list(islice(items, columns))
+            if not row:
+                break
+            row = [fmt.format(i)[:col_width] for i in row]
+            yield (I + sep.join(row)).rstrip()
+
 if __name__ == "__main__":
     # Running as a script provides a utility similar to pr.
     import sys, getopt
@@ -232,6 +363,7 @@ if __name__ == "__main__":
     alignment = "left"
     separator = " "
     truncate = False
+    sample_size = 1000
     def Usage(status=1):
         name = sys.argv[0]
         out('''
@@ -245,6 +377,9 @@ Options
     -a s
         Align each column as indicated by s:  left or <, center or ^,
         right or >.
+    -b
+        Print the lines top to bottom in blocks of LINES - 1 rows.  The
+        input is read a block at a time, so it can be of any length.
     -c n    
         Force number of columns to be n.  Resulting line length
         ignores COLUMNS; no strings are truncated.
@@ -253,24 +388,35 @@ Options
         the output within the given number of LINES and COLUMNS.
     -h
         Print this help message
+    -l
+        Print the lines left to right as soon as a row's worth is read,
+        so the input can be of any length.
+    -p
+        Make each column only as wide as its longest string and use as
+        many columns as will fit (like ls).
     -s s
         Separate each column by the string s.
     -t 
         Truncate each string if needed to fit into the column width.
     -w n
-        Set the column width.
-'''[1:] % locals())
+        Set the column width.  With -b or -l, the default is the length
+        of the longest of the first %(sample_size)d lines; longer lines
+        are truncated.
+'''[1:] % dict(locals(), sample_size=sample_size))
         exit(status)
     def ParseCommandLine(d):
         d["-a"] = "left"        # Alignment
+        d["-b"] = False         # Stream top to bottom in blocks
         d["-c"] = 0             # Requested number of columns
         d["-f"] = False         # Fit into available screen
         d["-i"] = None          # Indent string
+        d["-l"] = False         # Stream left to right
+        d["-p"] = False         # Pack variable width columns
         d["-s"] = " "           # Separator
         d["-t"] = False         # Truncate
         d["-w"] = 0             # Column width
         try:
-            optlist, args = getopt.getopt(sys.argv[1:], "a:c:fhi:s:tw:")
+            optlist, args = getopt.getopt(sys.argv[1:], "a:bc:fhi:lps:tw:")
         except getopt.GetoptError as str:
             msg, option = str
             out(msg + nl)
@@ -278,6 +424,8 @@ Options
         for opt in optlist:
             if opt[0] == "-a":
                 d["-a"] = opt[1]
+            if opt[0] == "-b":
+                d["-b"] = not d["-b"]
             if opt[0] == "-c":
                 d["-c"] = int(opt[1])
                 if d["-c"] <= 0:
@@ -289,6 +437,10 @@ Options
                 Usage(0)
             if opt[0] == "-i":
                 d["-i"] = opt[1].decode("string_escape")
+            if opt[0] == "-l":
+                d["-l"] = not d["-l"]
+            if opt[0] == "-p":
+                d["-p"] = not d["-p"]
             if opt[0] == "-s":
                 d["-s"] = opt[1].decode("string_escape")
             if opt[0] == "-t":
@@ -297,13 +449,34 @@ Options
                 d["-w"] = abs(int(opt[1]))
         return args
     def GetInput(files):
+        '''Generate the lines of the files (or stdin).
+        '''
         if not files:
-            lines = [i.rstrip() for i in sys.stdin.readlines()]
+            # Don't use iteration over sys.stdin because it reads ahead
+            for line in iter(sys.stdin.readline, ""):
+                yield line.rstrip()
         else:
-            lines = []
             for file in files:
-                lines += [i.rstrip() for i in open(file).readlines()]
-        return lines
+                for line in open(file):
+                    yield line.rstrip()
+    def Stream(lines, d):
+        '''Print the lines for the -b or -l options.
+        '''
+        kw = {
+            "align"     : d["-a"],
+            "col_width" : d["-w"],
+            "columns"   : d["-c"],
+            "indent"    : d["-i"],
+            "sample"    : sample_size,
+            "sep"       : d["-s"],
+            "width"     : int(os.environ.get("COLUMNS", 80)) - 1,
+        }
+        if d["-b"]:
+            kw["rows"] = max(1, int(os.environ.get("LINES", 25)) - 1)
+        for i in ColumnizeStream(lines, **kw):
+            out(i + nl)
+            sys.stdout.flush()
+        exit(0)
     def Fit(lines, d):
         '''Find out how many LINES and COLUMNS we have for the screen.
         Then adjust the parameters to Columnize to get the lines to
@@ -319,6 +492,13 @@ Options
         separator = " "
         width = int(os.environ["COLUMNS"]) - 1
         length = int(os.environ["LINES"]) - 2
+        # Use variable width columns if they fit without truncation
+        s = Columnize(lines, align=d["-a"], pack=True, sep=separator,
+                      width=width)
+        if len(s) <= length:
+            for i in s:
+                out(i + nl)
+            exit(0)
         maxlen = max([len(i) for i in lines])
         n = int(len(lines)//length)
         # Calculate truncation.  The formula for total width W is
@@ -345,9 +525,21 @@ Options
         exit(0)
     d = {}
     files = ParseCommandLine(d)
-    lines = GetInput(files)
+    if d["-b"] or d["-l"]:
+        Stream(GetInput(files), d)
+    lines = list(GetInput(files))
     if d["-f"]:
         Fit(lines, d)
+    elif d["-p"]:
+        kw = {
+            "align"     : d["-a"],
+            "indent"    : d["-i"],
+            "pack"      : True,
+            "sep"       : d["-s"],
+            "width"     : int(os.environ["COLUMNS"]) - 1,
+        }
+        for i in Columnize(lines, **kw):
+            out(i + nl)
     else:
         if d["-c"]:
             kw = {
@@ -0,0 +1,41 @@
+from __future__ import print_function
+import os
+import subprocess
+import sys
+from columnize import ColumnizeStream
+from lwtest import run, assert_equal
+
+items = ["a", "bb", "ccc", "dddd", "e", "ff", "ggg"]
+
+def testStreamHorizontal():
+    got = list(ColumnizeStream(items, columns=3, col_width=4))
+    assert_equal(got, ["a    bb   ccc", "dddd e    ff", "ggg"])
+    got = list(ColumnizeStream(items, columns=3, indent="xx", sep="|"))
+    assert_equal(got, ["xxa   |bb  |ccc", "xxdddd|e   |ff", "xxggg"])
+
+def testStreamBlocks():
+    kw = {"columns": 2, "col_width": 4, "rows": 2}
+    got = list(ColumnizeStream(items, **kw))
+    assert_equal(got, ["a    ccc", "bb   dddd", "e    ggg", "ff"])
+    # The indent doesn't take away from the width sized for columns
+    got = list(ColumnizeStream(items, indent="xx", width=12, **kw))
+    assert_equal(got, ["xxa    ccc", "xxbb   dddd", "xxe    ggg", "xxff"])
+    got = list(ColumnizeStream(items, indent="xx", width=12, rows=2))
+    assert_equal(got, ["xxa    ccc", "xxbb   dddd", "xxe    ggg", "xxff"])
+
+def testScript():
+    env = dict(os.environ, COLUMNS="12", LINES="3")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "columnize.py")
+    for option in ("-b", "-l"):
+        p = subprocess.Popen([sys.executable, script, option, "-i", "xx"],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, env=env)
+        output, error = p.communicate("\n".join(items) + "\n")
+        assert_equal((p.returncode, error), (0, ""))
+        lines = output.splitlines()
+        assert_equal(len(lines), 4)
+        assert(all(i.startswith("xx") and len(i) <= 11 for i in lines))
+
+if __name__ == "__main__":
+    run(globals())
@@ -17,7 +17,13 @@ ANY KIND. See http://www.dspguru.com/wide-open-license for more
 information.
 '''
 
-import sys, getopt, re
+import sys, getopt, re, heapq, tempfile, struct, itertools
+
+try:
+    from hashlib import blake2b
+except ImportError:
+    blake2b = None
+    from hashlib import md5
 
 
 out = sys.stdout.write
@@ -28,6 +34,18 @@ ignore_whitespace = False
 ignore_regexps    = []
 sort_results      = True
 element_string    = None
+external_sort     = False
+use_digests       = False
+
+# With -e, this many lines are sorted in memory at a time and written
+# to a temporary run file; at most max_runs run files are merged at
+# once.
+run_size = 100000
+max_runs = 100
+
+# With -d, the sets hold integers made from this many bytes of each
+# line's digest instead of the lines.
+digest_size = 8
 
 def Usage(status):
     print '''Usage:  fset.py [options] op file1 file2 [file3 ...]
@@ -54,8 +72,23 @@ def Usage(status):
   Output is sent to stdout and is sorted; use the -s option if you don't
   want the lines sorted (they will be in an indeterminate order, however,
   as a set has no notion of ordering).
+
+  Use the -e option for files that are too big to read into memory.
+  Each file's lines are sorted in pieces that are written to temporary
+  files, then merged and compared in one pass.  The output is always
+  sorted.
+
+  The -d option uses less memory:  the sets hold a 64 bit hash of each
+  line instead of the line and the files are read a second time to get
+  the lines that are in the result.  There's a very small chance that
+  two different lines will have the same hash.
   
 Options
+    -d
+        Keep hashes of the lines instead of the lines.
+    -e
+        Sort the lines with temporary files instead of holding them in
+        memory.
     -i regexp
         Ignore lines that contain the regexp.  More than one of these 
         options may be given.
@@ -86,12 +119,18 @@ def ParseCommandLine():
     if len(sys.argv) < 2:
         Usage(1)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "i:sw")
+        optlist, args = getopt.getopt(sys.argv[1:], "dei:sw")
     except getopt.GetoptError as e:
         msg, option = e
         out(msg + nl)
         sys.exit(1)
     for opt in optlist:
+        if opt[0] == "-d":
+            global use_digests
+            use_digests = True
+        if opt[0] == "-e":
+            global external_sort
+            external_sort = True
         if opt[0] == "-i":
             r = re.compile(opt[1])
             ignore_regexps.append(r)
@@ -129,11 +168,197 @@ def GetLines(op, files):
             lines2 = [line.strip() for line in lines2]
     return frozenset(lines1), frozenset(lines2)
 
+def ReadLines(files):
+    '''Generate the lines of the files that aren't ignored, stripped
+    if ignore_whitespace is True.
+    '''
+    for file in files:
+        for line in open(file):
+            for r in ignore_regexps:
+                if r.search(line):
+                    break
+            else:
+                yield line.strip() if ignore_whitespace else line
+
+def WriteRun(lines):
+    '''Write the sorted lines to a temporary file and return it.  A
+    line may not end with a newline (the last line of a file or any
+    line with -w), so each line is written with a leading "1" if it
+    ends with a newline and "0" if it doesn't.
+    '''
+    f = tempfile.TemporaryFile()
+    for line in lines:
+        if line.endswith(nl):
+            f.write("1" + line)
+        else:
+            f.write("0" + line + nl)
+    f.seek(0)
+    return f
+
+def ReadRun(f):
+    '''Generate the lines written to f by WriteRun().
+    '''
+    for line in f:
+        yield line[1:] if line[0] == "1" else line[1:-1]
+    f.close()
+
+def Unique(lines):
+    '''Generate the sorted lines without the repeated ones.
+    '''
+    last = None
+    for line in lines:
+        if line != last:
+            yield line
+            last = line
+
+def SortedLines(files):
+    '''Generate the different lines of the files in sorted order.  Only
+    run_size lines are held in memory at a time.
+    '''
+    runs, chunk = [], []
+    for line in ReadLines(files):
+        chunk.append(line)
+        if len(chunk) >= run_size:
+            runs.append(WriteRun(sorted(set(chunk))))
+            chunk = []
+        if len(runs) > max_runs:
+            # Merge the runs so we don't have too many files open
+            runs = [WriteRun(Unique(heapq.merge(*[ReadRun(f) for f in runs])))]
+    runs = [ReadRun(f) for f in runs] + [iter(sorted(set(chunk)))]
+    return Unique(heapq.merge(*runs))
+
+def Join(lines1, lines2):
+    '''lines1 and lines2 are sorted iterables without repeated lines.
+    Generate (line, in1, in2) tuples in sorted order for each line in
+    either of them; in1 and in2 are True if the line is in lines1 and
+    lines2, respectively.
+    '''
+    lines1, lines2 = iter(lines1), iter(lines2)
+    a, b = next(lines1, None), next(lines2, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a < b):
+            yield a, True, False
+            a = next(lines1, None)
+        elif a is None or b < a:
+            yield b, False, True
+            b = next(lines2, None)
+        else:
+            yield a, True, True
+            a, b = next(lines1, None), next(lines2, None)
+
+def ExternalSort(op, files):
+    '''Perform the operation op with one merge of the sorted lines
+    of files[0] and files[1:].  Return the status.
+    '''
+    status = 0
+    if op == "el":
+        found = any(line == files[1] + nl for line in open(files[0]))
+        out(str(found) + nl)
+        return 0 if found else 1
+    joined = Join(SortedLines(files[:1]), SortedLines(files[1:]))
+    if op in ("di", "sd", "in", "un"):
+        eol = ""
+        if ignore_whitespace:
+            eol = "\n"
+        keep = {
+            "di" : lambda in1, in2: in1 and not in2,
+            "sd" : lambda in1, in2: in1 != in2,
+            "in" : lambda in1, in2: in1 and in2,
+            "un" : lambda in1, in2: True,
+        }[op]
+        for line, in1, in2 in joined:
+            if keep(in1, in2):
+                out(line + eol)
+    elif op in ("eq", "ne"):
+        equal = all(in1 and in2 for line, in1, in2 in joined)
+        out(str(equal if op == "eq" else not equal) + nl)
+        if equal != (op == "eq"):
+            status = 1
+    elif op == "is":
+        subset, proper = True, False
+        for line, in1, in2 in joined:
+            if not in2:
+                subset = False
+                break
+            if not in1:
+                proper = True
+        out(str(subset and proper) + nl)
+        if not (subset and proper):
+            status = 1
+    return status
+
+# Digest(line) returns an integer made from digest_size bytes of the
+# line's digest.  md5 is used if blake2b isn't available.
+_unpack = struct.Struct("<Q").unpack
+if blake2b is not None:
+    def Digest(line):
+        return _unpack(blake2b(line, digest_size=digest_size).digest())[0]
+else:
+    def Digest(line):
+        return _unpack(md5(line).digest()[:digest_size])[0]
+
+def Recover(files, digests):
+    '''Generate the lines of files whose digests are in the set
+    digests, each only once.  Found digests are removed from the set.
+    '''
+    for line in ReadLines(files):
+        h = Digest(line)
+        if h in digests:
+            digests.remove(h)
+            yield line
+
+def DigestSets(op, files):
+    '''Perform the operation op using sets of the digests of the lines
+    of files[0] and files[1:].  The lines in the result are gotten by
+    reading the files again.  Return the status.
+    '''
+    if op == "el":
+        found = any(line == files[1] + nl for line in open(files[0]))
+        out(str(found) + nl)
+        return 0 if found else 1
+    set1 = set(Digest(i) for i in ReadLines(files[:1]))
+    set2 = set(Digest(i) for i in ReadLines(files[1:]))
+    status = 0
+    if op in ("eq", "ne", "is"):
+        if op == "eq":
+            result = set1 == set2
+        elif op == "ne":
+            result = set1 != set2
+        else:
+            result = set1 < set2
+        out(str(result) + nl)
+        return 0 if result else 1
+    if op == "di":
+        results = Recover(files[:1], set1 - set2)
+    elif op == "sd":
+        results = itertools.chain(Recover(files[:1], set1 - set2),
+                                  Recover(files[1:], set2 - set1))
+    elif op == "in":
+        results = Recover(files[:1], set1 & set2)
+    elif op == "un":
+        results = itertools.chain(Recover(files[:1], set1),
+                                  Recover(files[1:], set2 - set1))
+    del set1, set2
+    eol = ""
+    if ignore_whitespace:
+        eol = "\n"
+    if sort_results:
+        results = sorted(results)
+    for line in results:
+        out(line + eol)
+    return status
+
 def main():
     args = ParseCommandLine()
     op = args[0]
     del args[0]
     files = args
+    if external_sort:
+        ExternalSort(op, files)
+        return
+    if use_digests:
+        DigestSets(op, files)
+        return
     lines1, lines2 = GetLines(op, files)
     status = 0
     if op == "di":
@@ -61,6 +61,11 @@ the repository (filenames beginning with '.' are ignored unless the -a
 option is used).  The -R option gives the filenames as absolute paths
 so e.g. further processing by a script could be done if desired.
 
+The parsed log is kept in the file .hg/delta.index of the repository.
+Each run only asks Mercurial for the revisions added since the last
+run, so the script stays fast on repositories with long histories.
+Delete the file if you want it rebuilt from scratch.
+
 ---------------------------------------------------------------------------
 Copyright (C) 2012 Don Peterson
 Contact:  gmail.com@someonesdad1
@@ -76,8 +81,8 @@ information.
 '''
 
 import sys, os, getopt, functools, time
-from collections import defaultdict
 import subprocess
+import cPickle as pickle
 
 from pdb import set_trace as xx
 if 0:
@@ -94,6 +99,18 @@ months = set(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug",
 hg = "d:/bin/TortoiseHg104/hg.exe"
 hg = "/usr/bin/hg"
 
+# The parsed log is kept in this file in the repository's .hg directory
+# so that only the revisions newer than the last indexed tip need to be
+# read from 'hg log'.
+index_name = "delta.index"
+index_version = 1
+
+# Template for 'hg log'.  Fields are separated by \x01, the files by \x02
+# and the records by \x00, none of which appear in file names or commit
+# messages.  Mercurial decodes the escapes in the template.
+template = (r"{rev}\x01{node|short}\x01{date|date}\x01"
+            r"{join(files, '\x02')}\x01{desc}\x00")
+
 def out(*v, **kw):
     sep = kw.setdefault("sep", " ")
     use_nl  = kw.setdefault("nl", True)
@@ -194,78 +211,100 @@ def GetRootDirectory(d):
     d["root"] = t
 
 def GetLog(d):
-    '''Run the command 'hg log -v' and parse it, returning a
-    dictionary keyed by file name.
+    '''Return the dictionary of changes keyed by the decimal revision
+    number and the dictionary of lists of revision numbers keyed by
+    the file names relative to the repository root.
+
+    These are kept in an index in the .hg directory.  Only the
+    revisions after the index's tip are gotten from 'hg log'; the log
+    starts at the indexed tip so that we can check it's still the same
+    changeset (it won't be if e.g. the history was stripped).  If it
+    isn't, the index is rebuilt from revision 0.
     '''
-    # Here's how we parse the output.  Read the whole command
-    # in as a single string.  Split this string on the character
-    # sequence '\n\nchangeset:'; this splits the string into the strings
-    # for each change.  Then parse the substring separately.
-    p = subprocess.PIPE
-    s = subprocess.Popen((hg, "log", "-v"), stdout=p, stderr=p)
-    t = ''.join(s.stdout.readlines()) 
-    # Split the string up into separate chunks for each checkin
-    fields = t.split(nl + nl + "changeset:")
-    for i, item in enumerate(fields):
-        if i:
-            # For all but the first, add the word back in so that the
-            # fields can be parsed uniformly.
-            fields[i] = "changeset:" + item
-    changes = BuildDict(fields, d) 
-    e = s.stderr.read()
-    if e:
+    index_file = os.path.join(d["root"], ".hg", index_name)
+    index = LoadIndex(index_file)
+    changes, by_file = index["changes"], index["by_file"]
+    start = max(changes) if changes else 0
+    records = RunLog(start)
+    if changes:
+        if (records is None or not records or
+                records[0]["changeset"] != changes[start]["changeset"]):
+            # The history changed, so start over
+            index = NewIndex()
+            changes, by_file = index["changes"], index["by_file"]
+            records = RunLog(0)
+        else:
+            del records[0]
+    if records is None:
         raise Exception("GetLog:  Error in hg command")
-    return changes
-
-def BuildDict(fields, D):
-    '''fields is a list of strings from the 'hg log -v' command; an
-    example of one of the strings is:
-
-        changeset:   76:6eec7a578384
-        user:        abcd
-        date:        Tue Jun 26 17:42:26 2012 -0600
-        files:       .profile 0todo.odt help.odt i2c/0readme i2c/0todo
-        description:
-        Tue 26 Jun 2012 05:42:26 PM
-
-    fields contains one string for each checkin.  Parse each
-    substring into its fields (i.e., changeset, tag, user, data,
-    files, and description) and put into a dictionary keyed by the
-    decimal revision number.  D is the options dictionary.  Note we
-    also create a new key called files_d which is a list of each of
-    the files, but with their absolute path in the repository.
+    for record in records:
+        rev = int(record["changeset"][0])
+        changes[rev] = record
+        for file in record["files"]:
+            by_file.setdefault(file, []).append(rev)
+    if records:
+        SaveIndex(index_file, index)
+    return changes, by_file
+
+def RunLog(start):
+    '''Run 'hg log' for the revisions from start to the tip and return
+    a list of the parsed records in increasing revision order, or None
+    if the command failed.
     '''
-    changes = dict()
-    for i, f in enumerate(fields):
-        g, d = f.split(nl), dict()
-        for j, item in enumerate(g):
-            if item != "description:":
-                loc = item.find(":")
-                if loc == -1:
-                    msg = "Bad field in %dth change record" % i
-                    raise ValueError(msg)
-                name, value = item[:loc].strip(), item[loc + 1:].strip()
-                if name in ("date", "files"):
-                    value = value.split()
-                    if name == "files":
-                        d["files_d"] = [Absolute(i, D) for i in value]
-                elif name == "changeset":
-                    value = value.split(":")
-                d[name] = value
-            else:
-                d["description"] = g[j + 1:]
-                break
-        key = int(d["changeset"][0])
-        changes[key] = d
-    if 0:
-        # Dump data to stdout
-        for k in changes:
-            out(k)
-            for i in changes[k]:
-                out(" ", i, ":", changes[k][i])
-            out()
-        exit()
-    return changes
+    p = subprocess.PIPE
+    s = subprocess.Popen((hg, "log", "-r", "%d:tip" % start, "--template",
+                          template), stdout=p, stderr=p)
+    t, e = s.communicate()
+    if e or s.returncode:
+        return None
+    return [ParseRecord(i) for i in t.split("\x00") if i]
+
+def ParseRecord(record):
+    '''record is the string output by the log template for one
+    changeset.  Return a dictionary with the keys:
+        changeset       [decimal revision number, short hash]
+        date            List of the date's fields, e.g., 
+                        ['Tue', 'Jun', '26', '17:42:26', '2012', '-0600']
+        files           List of files relative to the repository root
+        description     List of the lines of the commit message
+    '''
+    rev, node, date, files, desc = record.split("\x01", 4)
+    return {
+        "changeset": [rev, node],
+        "date": date.split(),
+        "files": [i for i in files.split("\x02") if i],
+        "description": desc.split(nl),
+    }
+
+def NewIndex():
+    return {"version": index_version, "changes": {}, "by_file": {}}
+
+def LoadIndex(index_file):
+    '''Return the index stored in index_file or a new index if it
+    can't be read.
+    '''
+    try:
+        with open(index_file, "rb") as f:
+            index = pickle.load(f)
+        if index.get("version") == index_version:
+            return index
+    except Exception:
+        pass
+    return NewIndex()
+
+def SaveIndex(index_file, index):
+    '''Write the index.  Failure to write it isn't an error; the next
+    run will just have more revisions to read.
+    '''
+    tmp = index_file + ".%d" % os.getpid()
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+        if sys.platform == "win32" and os.path.exists(index_file):
+            os.remove(index_file)
+        os.rename(tmp, index_file)
+    except (IOError, OSError):
+        pass
 
 def Absolute(file, d):
     '''Turn file into an absolute path starting with the Mercurial
@@ -314,12 +353,13 @@ def GetDescription(data):
         del data[-1]
     return nl.join(data)
 
-def ArrangeByFile(changes, D):
-    '''Return a dict where the keys are the filenames in the
-    repository (the insertion order is in alphabetical order).  Each
-    name will contain a list of the keys into the changes dictionary.
-    D is the options dictionary.  Example contents for 
-    d:/p/pylib (key, value):
+def ArrangeByFile(by_file, D):
+    '''Return a dict where the keys are the absolute filenames in the
+    repository.  Each name will contain a list of the keys into the
+    changes dictionary.  by_file is the index's dictionary of
+    revision lists (in increasing order) keyed by the file names
+    relative to the repository root.  D is the options dictionary.
+    Example contents for d:/p/pylib (key, value):
         (D:/p/pylib/2up.py, [53, 13])
         (D:/p/pylib/2word.py, [314, 300, 261, 81])
         (D:/p/pylib/3456.py, [314, 300, 152, 112, 111, 110, 10])
@@ -327,51 +367,14 @@ def ArrangeByFile(changes, D):
         (D:/p/pylib/5_gallon_bucket.py, [205, 196, 195, 184, 168])
         ...
     '''
- 
-    # Implementation detail:  this implementation uses plain python
-    # dictionaries for storing the intermediate data structures.  For
-    # python 2.6.5 at least, this results in the dictionary keyed by
-    # the revision number to be in numerical order because integers
-    # hash to themselves; i.e., when you iterate on the dictionary's
-    # keys, you get them ascending in numerical order.  This might not
-    # be true for other python versions; if so, use or find an ordered
-    # dictionary object and replace the dict() constructor everywhere
-    # by odict().  You'll then probably have to switch the sense of
-    # the d["-e"] test when printing to get things to work correctly.
- 
-    # Get a set of the file names
-    fn = []
-    for revision_number in changes:
-        try:
-            # Note we're using the files with paths prepended
-            fn += changes[revision_number]["files_d"]
-        except KeyError:
-            pass
-    fn = list(set(fn))
-    # Now build a dictionary whose keys are the absolute paths to the
-    # files and where each value is a list of revisions made to that
-    # file.
-    changes_by_file = defaultdict(list)
-    for revision_number in changes:
-        if "files_d" in changes[revision_number]:
-            for abspath in changes[revision_number]["files_d"]:
-                changes_by_file[abspath] += [revision_number]
-    # Sort the data and insert into a dict
     arranged = dict()
-    files = changes_by_file.keys()
-    files.sort()
-    for file in files:
-        if 0 in changes_by_file[file] and not D["-0"]:
-            changes_by_file[file].remove(0)
+    for file, revisions in by_file.items():
+        if revisions[0] == 0 and not D["-0"]:
+            revisions = revisions[1:]
         if D["-e"]:  # Earliest first
-            arranged[file] = changes_by_file[file]
+            arranged[Absolute(file, D)] = list(revisions)
         else:
-            arranged[file] = list(reversed(changes_by_file[file]))
-    if 0:
-        # Print out arranged
-        for i in arranged:
-            print i, arranged[i]
-        exit()
+            arranged[Absolute(file, D)] = list(reversed(revisions))
     return arranged
 
 def PrintItem(file, change_list, changes, d):
@@ -429,13 +432,14 @@ def PrintItem(file, change_list, changes, d):
                     return
                 Print(Normalize(os.path.relpath(p, d["cwd"])))
 
-def PrintResults(args, changes, d):
+def PrintResults(args, changes, by_file, d):
     '''args contains the command line arguments.  changes is a dict
     keyed by the decimal revision number.  Each value is another dict
-    containing the data on that particular revision.  Depending on the
+    containing the data on that particular revision.  by_file is a
+    dict of the revision numbers keyed by file.  Depending on the
     desires of the user, print out the requested information.
     '''
-    changes_by_file = ArrangeByFile(changes, d)
+    changes_by_file = ArrangeByFile(by_file, d)
     # Now changes_by_file contains entries like:
     # { "D:/p/pylib/2up.py"   : [53, 13], 
     #   "D:/p/pylib/2word.py" : [314, 300, 261, 81], 
@@ -470,8 +474,8 @@ def main():
     d = {} # Options dictionary
     args = ParseCommandLine(d)
     GetRootDirectory(d)
-    changes = GetLog(d)
-    PrintResults(args, changes, d)
+    changes, by_file = GetLog(d)
+    PrintResults(args, changes, by_file, d)
 
 if __name__ == "__main__":
     main()
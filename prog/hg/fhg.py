@@ -4,13 +4,21 @@ Find all Mercurial directories at and under the current directory.
 
 from __future__ import print_function
 import sys, os, getopt, subprocess
+from multiprocessing.dummy import Pool as ThreadPool
 from color import *
+import hgcache
 from pdb import set_trace as xx
 
 # Set to the Mercurial command's location
 hg = "d:/bin/TortoiseHg104/hg.exe"
 hg = "/usr/bin/hg"
 
+# Default number of 'hg status' commands to run at the same time
+numprocs = 8
+
+# Set to an hgcache.StatusCache object by the -C option
+cache = None
+
 # Colors used to indicate various Mercurial states
 states = {
     "M" : yellow,           # Modified
@@ -33,15 +41,65 @@ Usage:  {name} [options] dir1 [dir2...]
 Options
     -c 
         Don't show clean directories.
+    -C
+        Only run 'hg status' in the repositories whose .hg/dirstate
+        file or root directory has changed since the last run; the
+        other results come from the cache in {cache_file}.  Note
+        editing a tracked file changes neither, so use this for a
+        quick look, not a final check.
+    -j num
+        Run up to num 'hg status' commands at the same time.  Defaults
+        to {numprocs}.
+    -n
+        Also look for nested repositories inside a repository's working
+        directory.  Normally the search stops at a repository.
 '''[1:-1]
-    print(s.format(**locals()))
+    print(s.format(name=name, numprocs=numprocs,
+                   cache_file=hgcache.cache_file))
     sys.exit(status)
 
-def ProcessDir(dir, d):
-    level = 0
+def FindRepositories(dir, d):
+    '''Generator that yields the repositories at and below dir.  The
+    .hg directories aren't descended into and, unless -n was given,
+    neither are the working directories of the repositories found.
+    '''
     for root, dirs, files in os.walk(dir):
         if ".hg" in dirs:
-            Report(root.replace("\\", "/"), d)
+            yield root.replace("\\", "/")
+            if d["-n"]:
+                dirs.remove(".hg")
+            else:
+                del dirs[:]
+        dirs.sort()
+
+def GetStatus(dir):
+    '''Return (dir, lines) where lines are the output lines of 'hg
+    status' run in the repository dir.  This is run in a thread pool,
+    so the command's working directory is passed to Popen rather than
+    changing the process' working directory.
+    '''
+    if cache:
+        lines = cache.Get(dir)
+    else:
+        p = subprocess.PIPE
+        s = subprocess.Popen((hg, "status"), stdout=p, cwd=dir)
+        lines = s.communicate()[0].splitlines()
+    return dir, [i.strip().replace("\\", "/") for i in lines]
+
+def ProcessDir(dir, d):
+    '''Run 'hg status' in each repository found at and below dir with
+    a bounded pool of threads.  The results are reported in the order
+    the repositories were found, each as soon as it and the ones before
+    it have finished.
+    '''
+    pool = ThreadPool(d["-j"])
+    try:
+        for repository, results in pool.imap(GetStatus,
+                                             FindRepositories(dir, d)):
+            Report(repository, results, d)
+    finally:
+        pool.close()
+        pool.join()
 
 def Line(indent, letter, text):
     print(indent, end="")
@@ -102,9 +160,10 @@ def Status(dir, status, d):
         print(i)
         normal()
 
-def Report(dir, d):
-    '''dir is a Mercurial directory.  Find out if its status indicates
-    the repository has changed; if so, print out the name in color.
+def Report(dir, results, d):
+    '''dir is a Mercurial directory and results are the lines of its
+    'hg status' output.  Find out if its status indicates the
+    repository has changed; if so, print out the name in color.
     Note:  the status command prints out the following prefixes:
  
         M = modified
@@ -117,11 +176,6 @@ def Report(dir, d):
           = origin of the previous file listed as A (added)
     The color is printed only for prefixes of M, A, R, and ?.
     '''
-    cwd = os.getcwd()
-    os.chdir(dir)
-    p = subprocess.PIPE
-    s = subprocess.Popen((hg, "status"), stdout=p)
-    results = [i.strip().replace("\\", "/") for i in s.stdout.readlines()]
     if d["-s"]:
         Status(dir, results, d)
         return
@@ -151,13 +205,15 @@ def Report(dir, d):
         if not d["-c"]:
             print(dir)
         normal()
-    os.chdir(cwd)
 
 def ParseCommandLine(d):
     d["-c"] = True      # Don't show clean directories
+    d["-C"] = False     # Use the status cache
+    d["-j"] = numprocs  # Number of concurrent 'hg status' commands
+    d["-n"] = False     # Look for nested repositories
     d["-s"] = False     # Show 'hg st' type listing
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "chs")
+        optlist, args = getopt.getopt(sys.argv[1:], "cChj:ns")
     except getopt.GetoptError as e:
         msg, option = e
         print(msg)
@@ -165,8 +221,20 @@ def ParseCommandLine(d):
     for opt in optlist:
         if opt[0] == "-c":
             d["-c"] = False
+        if opt[0] == "-C":
+            d["-C"] = True
         if opt[0] == "-h":
             Usage()
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                print("'%s' is not a valid number of commands" % opt[1])
+                exit(1)
+        if opt[0] == "-n":
+            d["-n"] = True
         if opt[0] == "-s":
             d["-s"] = True
     if not args:
@@ -179,9 +247,17 @@ def main():
     print('''
 Search for dirty Mercurial repositories.  Options:
     -c      Show both clean and dirty repositories
+    -C      Use cached results for repositories that haven't changed
+    -j n    Run up to n 'hg status' commands at the same time
+    -n      Also look for repositories nested in working directories
     -s      Display the same information as 'hg st' but in color
 '''[1:])
     Header(d)
+    global cache
+    if d["-C"]:
+        cache = hgcache.StatusCache(hg)
     for dir in dirs:
         ProcessDir(dir, d)
+    if cache:
+        cache.Save()
 main()
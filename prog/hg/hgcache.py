@@ -0,0 +1,131 @@
+'''
+Cache of Mercurial command output for repositories that haven't changed.
+
+The StatusCache object remembers the output of commands like 'hg status'
+for each repository along with a stamp made from the modification times
+of the repository's .hg/dirstate file and of its root directory.  The
+command is only run again when the stamp changes.
+
+Note the dirstate file and the root directory are only changed by
+Mercurial commands and by adding, removing or renaming files in the
+root directory.  Editing a file that is already tracked changes neither,
+so a cached status can miss a modified file.  fhg.py and hgs.py only
+use the cache when asked to (see their -C options).
+
+---------------------------------------------------------------------------
+Copyright (C) 2012 Don Peterson
+Contact:  gmail.com@someonesdad1
+
+                         The Wide Open License (WOL)
+
+Permission to use, copy, modify, distribute and sell this software and its
+documentation for any purpose is hereby granted without fee, provided that
+the above copyright notice and this license appear in all copies.
+THIS SOFTWARE IS PROVIDED "AS IS" WITHOUT EXPRESS OR IMPLIED WARRANTY OF
+ANY KIND. See http://www.dspguru.com/wide-open-license for more
+information.
+'''
+
+import os
+import sys
+import subprocess
+import threading
+import cPickle as pickle
+
+# Default location of the cache file
+cache_file = os.path.join(os.path.expanduser("~"), ".hgcache")
+
+def FindRoot(dir):
+    '''Return the root directory of the Mercurial repository that dir
+    is in or None if it isn't in a repository.  This is what 'hg root'
+    does, but without starting a process.
+    '''
+    dir = os.path.abspath(dir)
+    while True:
+        if os.path.isdir(os.path.join(dir, ".hg")):
+            return dir
+        parent = os.path.dirname(dir)
+        if parent == dir:
+            return None
+        dir = parent
+
+def Stamp(root):
+    '''Return the (dirstate mtime, root directory mtime) tuple for the
+    repository at root or None if they can't be gotten.
+    '''
+    try:
+        dirstate = os.stat(os.path.join(root, ".hg", "dirstate")).st_mtime
+        return (dirstate, os.stat(root).st_mtime)
+    except OSError:
+        return None
+
+class StatusCache(object):
+    '''Holds the output lines of Mercurial commands keyed by the
+    repository's root directory and the command's arguments.  The
+    methods can be called from more than one thread.
+    '''
+    def __init__(self, hg, filename=cache_file):
+        self.hg = hg
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.changed = False
+        try:
+            with open(filename, "rb") as f:
+                self.entries = pickle.load(f)
+            if not isinstance(self.entries, dict):
+                raise ValueError("Bad cache")
+        except Exception:
+            self.entries = {}
+
+    def Run(self, root, args):
+        '''Return the lines of output from running hg with the sequence
+        of arguments args in the directory root.
+        '''
+        p = subprocess.PIPE
+        s = subprocess.Popen((self.hg,) + tuple(args), stdout=p, cwd=root)
+        output = s.communicate()[0]
+        return [i.rstrip("\r\n") for i in output.splitlines()]
+
+    def Get(self, root, args=("status",)):
+        '''Return the output lines of 'hg args' for the repository at
+        root.  The command is only run if the repository's stamp is
+        different from the one the cached lines were made with.
+        '''
+        root = os.path.abspath(root)
+        key = (root, tuple(args))
+        stamp = Stamp(root)
+        with self.lock:
+            entry = self.entries.get(key)
+        if stamp is not None and entry is not None and entry[0] == stamp:
+            return entry[1]
+        lines = self.Run(root, args)
+        # Only remember the output if the repository didn't change
+        # while the command was running.
+        if stamp is not None and Stamp(root) == stamp:
+            with self.lock:
+                self.entries[key] = (stamp, lines)
+                self.changed = True
+        return lines
+
+    def Save(self):
+        '''Write the cache if it has changed.  A temporary file is
+        renamed to the cache file so that readers never see a partly
+        written cache.
+        '''
+        if not self.changed:
+            return
+        # Forget the repositories that no longer exist
+        for key in list(self.entries):
+            if not os.path.isdir(os.path.join(key[0], ".hg")):
+                del self.entries[key]
+        tmp = self.filename + ".%d" % os.getpid()
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+            if sys.platform == "win32" and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp, self.filename)
+            self.changed = False
+        except (IOError, OSError) as e:
+            sys.stderr.write("Couldn't write cache '%s':  %s\n" %
+                             (self.filename, e))
@@ -0,0 +1,99 @@
+from __future__ import print_function
+import os
+import shutil
+import stat
+import tempfile
+from hgcache import FindRoot, Stamp, StatusCache
+from lwtest import run, assert_equal
+from pdb import set_trace as xx
+
+# A stub for the hg command so that Mercurial isn't needed.  It prints
+# the contents of the file named status in the working directory and
+# appends a line to the file named calls in the directory above it so
+# the number of times it was run can be counted.
+stub = '''#!/bin/sh
+echo "$@" >> ../calls
+cat status 2>/dev/null
+'''
+
+def Setup():
+    '''Make a repository in a temporary directory and return the
+    directory and the stub hg command.
+    '''
+    dir = tempfile.mkdtemp()
+    hg = os.path.join(dir, "hg")
+    with open(hg, "w") as f:
+        f.write(stub)
+    os.chmod(hg, stat.S_IRWXU)
+    repo = os.path.join(dir, "repo")
+    os.makedirs(os.path.join(repo, ".hg"))
+    Write(os.path.join(repo, ".hg", "dirstate"), "")
+    Write(os.path.join(repo, "status"), "M a.py\n? b.py\n")
+    return dir, hg, repo
+
+def Write(file, s):
+    with open(file, "w") as f:
+        f.write(s)
+
+def Calls(repo):
+    with open(os.path.join(repo, "..", "calls")) as f:
+        return len(f.readlines())
+
+def Touch(file):
+    # Make sure the mtime moves even on filesystems with coarse times
+    t = os.stat(file).st_mtime + 2
+    os.utime(file, (t, t))
+
+def testFindRoot():
+    dir, hg, repo = Setup()
+    try:
+        sub = os.path.join(repo, "a", "b")
+        os.makedirs(sub)
+        assert_equal(FindRoot(sub), repo)
+        assert_equal(FindRoot(repo), repo)
+        assert(Stamp(repo) is not None)
+        assert(Stamp(dir) is None)
+    finally:
+        shutil.rmtree(dir)
+
+def testCache():
+    dir, hg, repo = Setup()
+    try:
+        file = os.path.join(dir, "cache")
+        cache = StatusCache(hg, file)
+        expected = ["M a.py", "? b.py"]
+        assert_equal(cache.Get(repo), expected)
+        assert_equal(Calls(repo), 1)
+        # Unchanged repository comes from the cache
+        assert_equal(cache.Get(repo), expected)
+        assert_equal(Calls(repo), 1)
+        # Different arguments are cached separately
+        cache.Get(repo, ("status", "-A"))
+        assert_equal(Calls(repo), 2)
+        # The cache persists
+        cache.Save()
+        cache = StatusCache(hg, file)
+        assert_equal(cache.Get(repo), expected)
+        assert_equal(Calls(repo), 2)
+        # Changing the dirstate causes the command to be run again
+        Write(os.path.join(repo, "status"), "")
+        Touch(os.path.join(repo, ".hg", "dirstate"))
+        assert_equal(cache.Get(repo), [])
+        assert_equal(Calls(repo), 3)
+        # So does changing the root directory
+        Write(os.path.join(repo, "status"), "? c.py\n")
+        Touch(repo)
+        assert_equal(cache.Get(repo), ["? c.py"])
+        assert_equal(Calls(repo), 4)
+        # Removed repositories are dropped when the cache is saved
+        cache.Save()
+        shutil.rmtree(os.path.join(repo, ".hg"))
+        cache = StatusCache(hg, file)
+        cache.changed = True
+        cache.Save()
+        assert_equal(StatusCache(hg, file).entries, {})
+    finally:
+        shutil.rmtree(dir)
+
+if __name__ == "__main__":
+    run(globals())
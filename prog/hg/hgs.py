@@ -30,6 +30,7 @@ import subprocess
 import itertools
 import collections
 import color as c
+import hgcache
 from pdb import set_trace as xx
 
 debug = 0   # Turns on debug printing
@@ -91,6 +92,7 @@ def Error(msg):
 
 def Usage(status=1):
     name = sys.argv[0]
+    cache_file = hgcache.cache_file
     s = '''
 Usage:  {name} [options] [dir]
   Lists files in . (or dir if given) that are not being tracked by
@@ -102,6 +104,10 @@ Usage:  {name} [options] [dir]
 Options
     -a  Show all files in a readable format
     -c  Show clean files (tracked files without changes)
+    -C  Use the 'hg status -A' output cached in {cache_file} if the
+        repository's .hg/dirstate file and root directory haven't
+        changed since it was cached.  Editing a tracked file changes
+        neither, so modified files can be missed.
     -h  Show this help
     -i  Show ignored files
     -m  Show modified files
@@ -122,6 +128,7 @@ Options
 def ParseCommandLine(d):
     d["-a"] = False     # Show all files
     d["-c"] = False     # Show clean files
+    d["-C"] = False     # Use the status cache
     d["-i"] = False     # Show ignored files
     d["-m"] = False     # Show modified files
     d["-M"] = False     # Show missing files
@@ -129,7 +136,7 @@ def ParseCommandLine(d):
     d["-r"] = False     # Show removed files
     d["dir"] = "."
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "acihmMr")
+        optlist, args = getopt.getopt(sys.argv[1:], "aCcihmMr")
     except getopt.GetoptError as str:
         msg, option = str
         out(msg + nl)
@@ -139,6 +146,8 @@ def ParseCommandLine(d):
             d["-a"] = True
         if opt[0] == "-c":
             d["-c"] = True
+        if opt[0] == "-C":
+            d["-C"] = True
         if opt[0] == "-h":
             Usage(0)
         if opt[0] == "-i":
@@ -175,19 +184,20 @@ def GetRoot():
     global root
     root = lines[0]
 
-def IsContained(file):
-    '''Return True if file is in a subdirectory of the current directory.
+def GetPrefix():
+    '''Return the path of the directory of interest relative to the
+    repository's root with a trailing '/' (or an empty string if it is
+    the root).  The files in 'hg status' output are relative to the
+    root, so a file is at or below the directory if it starts with the
+    prefix.
     '''
-    # This is done by converting file to a an absolute path, then seeing if
-    # the current directory is a substring anchored at position 0.
-    cwd = os.getcwd()
-    f = os.path.join(root, file)
-    loc = f.find(cwd)
-    return True if loc == 0 else False
+    rel = os.path.relpath(cwd, root).replace("\\", "/")
+    return "" if rel == "." else rel + "/"
 
 def GetFiles(d):
-    '''Get the full output of an 'hg status -A' command, then filter the
-    list by the given options.
+    '''Get the output of an 'hg status -A' command for the files at and
+    below the directory, then filter the list by the given options.
+    The file names returned are relative to the directory.
     '''
     try:
         os.chdir(d["dir"])
@@ -197,19 +207,37 @@ def GetFiles(d):
         cwd = os.path.abspath(os.getcwd())
     except WindowsError:
         Error("Couldn't cd to '%s'" % d["dir"])
-    GetRoot()
-    p = subprocess.PIPE
-    s = subprocess.Popen((hg, "status", "-A"), stdout=p)
-    results = [i.strip() for i in s.stdout.readlines()]
+    global root
+    if d["-C"]:
+        root = hgcache.FindRoot(cwd)
+        if root is None:
+            Error("'%s' isn't in a Mercurial repository" % d["dir"])
+    else:
+        GetRoot()
+    prefix = GetPrefix()
+    # Let Mercurial only look at the files under the directory.  The
+    # command is run in the root directory so that the file names it
+    # prints are relative to the root.
+    args = ("status", "-A")
+    if prefix:
+        args += ("path:" + prefix[:-1],)
+    if d["-C"]:
+        cache = hgcache.StatusCache(hg)
+        results = [i.strip() for i in cache.Get(root, args)]
+        cache.Save()
+    else:
+        p = subprocess.PIPE
+        s = subprocess.Popen((hg,) + args, stdout=p, cwd=root)
+        results = [i.strip() for i in s.stdout.readlines()]
     # Make a dictionary containing the relevant files keyed by the
-    # Mercurial status codes
+    # Mercurial status codes.  Only keep the files that are at or below
+    # the directory.
     files = collections.defaultdict(list)
+    n = len(prefix)
     for line in results:
-        files[line[0]].append(line[2:])
-    # For each key, only keep those directories in the list that are a
-    # subdirectory of the current directory.
-    for key in files:
-        files[key] = filter(IsContained, files[key])
+        file = line[2:].replace("\\", "/")
+        if file.startswith(prefix):
+            files[line[0]].append(file[n:])
     return files
 
 def Out(s):
@@ -225,40 +253,17 @@ def PrintItems(itemlist, name, d):
             s = raw_input()
             if s in ("q", "Q", "\x1b"):
                 exit(0)
-    # First, find out if there are any files to be printed in the
-    # current directory.
-    has_files = False
-    for item in itemlist:
-        p = os.path.join(root, item)
-        try:
-            p = os.path.relpath(p, cwd)
-        except ValueError:
-            continue
-        dir, filename = os.path.split(p)
-        if not dir:
-            has_files = True
-            break
-    if not has_files:
+    # Unless -R was given, only the files in the directory itself are
+    # printed.
+    if not d["-R"]:
+        itemlist = [i for i in itemlist if "/" not in i]
+    if not itemlist:
         return
     out(name)
     #Page(num_lines)
     for item in itemlist:
-        p = os.path.join(root, item)
-        try:
-            p = os.path.relpath(p, cwd)
-        except ValueError:
-            Out("  nul " + "<" + "-"*20)
-            #Page(num_lines)
-            continue
-        if d["-R"]:
-            Out("  " + p)
-            #Page(num_lines)
-        else:
-            # Only print this file if it's in the current directory
-            dir, filename = os.path.split(p)
-            if not dir:
-                Out("  " + p)
-                #Page(num_lines)
+        Out("  " + item)
+        #Page(num_lines)
 
 def PrintResults(files, d):
     '''files is a dictionary keyed by Mercurial status letter.  d is the
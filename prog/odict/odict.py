@@ -22,15 +22,17 @@ The odict can be initialized via:
             * dict(one=2, two=3), which is an allowed python form
               using keyword arguments.
 
-Warning:
-    If you iterate over the dictionary as is usual, you'll get the
-    keys in the typical hashed order of a regular dictionary:
-        for i in my_odict:
-            print(i)
-    will, in general, not give you the keys in the order you entered
-    them.  Instead, use:
-        for i in my_odict.keys():
-            print(i)
+The order is kept in a doubly linked list of [prev, next, key] nodes
+with a sentinel node; a dictionary maps each key to its node.  Thus
+deleting a key, pop(), popitem() and move_to_end() take constant time.
+Iterating over the odict, iterkeys(), itervalues(), iteritems() and the
+viewkeys(), viewvalues() and viewitems() objects walk the list without
+making a copy; keys(), values() and items() return new lists as for a
+dict.  Changing the odict while iterating over it is an error, as it
+is with a dict, but it isn't detected.
+
+odict_timing.py compares the speed of this implementation with the
+earlier one that kept the keys in a list.
 
 References
 ----------
@@ -49,7 +51,10 @@ References
 #
 #
 
-from collections import Iterable
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 
 class odict(dict):
     def __init__(self, *vars, **kw):
@@ -66,12 +71,14 @@ class odict(dict):
         Arbitrary number of keyword arguments
             * dict(one=2, two=3), which is an allowed python form.
         '''
-        self._seq = []  # Keeps track of key entry order
+        self._root = root = []  # Sentinel node of the linked list
+        root[:] = [root, root, None]
+        self._map = {}          # Key to its [prev, next, key] node
         if not vars:
             if not kw:
                 return
             else:
-                dict.update(self, kw)
+                self.update(kw)
         else:
             if len(vars) == 1:
                 item = vars[0]
@@ -112,11 +119,20 @@ class odict(dict):
             return True
         return False
 
+    def _unlink(self, key):
+        '''Remove key's node from the linked list.
+        '''
+        prev, next, key = self._map.pop(key)
+        prev[1] = next
+        next[0] = prev
+
     def clear(self):
         '''Removes all elements.
         '''
         dict.clear(self)
-        self._seq = []
+        root = self._root
+        root[:] = [root, root, None]
+        self._map.clear()
 
     def copy(self):
         '''Returns a copy of the odict.
@@ -124,46 +140,81 @@ class odict(dict):
         return odict(self)
 
     def items(self):
-        '''Returns a sequence of the key:value pairs.
+        '''Returns a list of the (key, value) pairs.
         '''
-        return zip(self._seq, self.values())
+        return list(self.iteritems())
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
-        self._seq.remove(key)
+        self._unlink(key)
 
     def __setitem__(self, key, value):
         if key not in self:
-            self._seq.append(key)
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._map[key] = [last, root, key]
         dict.__setitem__(self, key, value)
 
     def __repr__(self):
         s = "odict{"
         t = []
-        for i in self._seq:
+        for i in self:
             t.append(repr(i) + ": " + repr(self[i]))
         s += ", ".join(t)
         s += "}"
         return s
 
+    def __reduce__(self):
+        # The linked list is rebuilt rather than pickled
+        return (self.__class__, (self.items(),))
+
     def __iter__(self):
-        return iter(self._seq)
+        root = self._root
+        node = root[1]
+        while node is not root:
+            yield node[2]
+            node = node[1]
 
     iter = __iter__
 
+    def __reversed__(self):
+        root = self._root
+        node = root[0]
+        while node is not root:
+            yield node[2]
+            node = node[0]
+
     def iteritems(self):
-        for i in self._seq:
+        for i in self:
             yield i, self[i]
 
     def iterkeys(self):
-        return iter(self._seq)
+        return iter(self)
 
     def itervalues(self):
-        for i in self._seq:
+        for i in self:
             yield self[i]
 
     def keys(self):
-        return self._seq[:]
+        return list(self)
+
+    def move_to_end(self, key, last=True):
+        '''Move an existing key to the end of the order (or the
+        beginning if last is False).
+        '''
+        node = self._map[key]
+        prev, next, key = node
+        prev[1] = next
+        next[0] = prev
+        root = self._root
+        if last:
+            prev = root[0]
+            node[0], node[1] = prev, root
+            prev[1] = root[0] = node
+        else:
+            next = root[1]
+            node[0], node[1] = root, next
+            root[1] = next[0] = node
 
     def pop(self, key, default=None):
         if key not in self:
@@ -176,12 +227,15 @@ class odict(dict):
             del self[key]
             return value
 
-    def popitem(self):
-        if self._seq:
-            key = self._seq[-1]
+    def popitem(self, last=True):
+        '''Remove and return the last (key, value) pair (or the first
+        if last is False).
+        '''
+        if self._map:
+            root = self._root
+            key = root[0][2] if last else root[1][2]
             value = self[key]
-            dict.__delitem__(self, key)
-            del self._seq[-1]
+            del self[key]
             return key, value
         else:
             raise KeyError("Empty dictionary")
@@ -224,5 +278,44 @@ class odict(dict):
             self.update(kw)
 
     def values(self):
-        return [self[i] for i in self._seq]
+        return list(self.itervalues())
 
+    def viewitems(self):
+        '''Returns a view of the (key, value) pairs that doesn't copy
+        them.
+        '''
+        return _View(self, "items")
+
+    def viewkeys(self):
+        return _View(self, "keys")
+
+    def viewvalues(self):
+        return _View(self, "values")
+
+class _View(object):
+    '''A view of an odict's keys, values or items in order.  It
+    reflects later changes to the odict.
+    '''
+    def __init__(self, od, kind):
+        self._od = od
+        self._kind = kind
+
+    def __len__(self):
+        return len(self._od)
+
+    def __iter__(self):
+        return getattr(self._od, "iter" + self._kind)()
+
+    def __contains__(self, x):
+        od = self._od
+        if self._kind == "keys":
+            return x in od
+        elif self._kind == "items":
+            if not isinstance(x, tuple) or len(x) != 2:
+                return False
+            key, value = x
+            return key in od and od[key] == value
+        return any(i == x for i in self)
+
+    def __repr__(self):
+        return "odict_%s(%r)" % (self._kind, list(self))
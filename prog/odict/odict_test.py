@@ -0,0 +1,96 @@
+from __future__ import print_function
+import copy
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from odict import odict
+from lwtest import run, assert_equal, assert_raises
+
+def testInit():
+    assert_equal(odict().keys(), [])
+    assert_equal(odict([(3, "c"), (1, "a"), 2]).items(),
+                 [(3, "c"), (1, "a"), (2, None)])
+    assert_equal(odict(list("cab"), range(3)).keys(), ["c", "a", "b"])
+    od = odict(a=1, b=2)
+    assert_equal(sorted(od.keys()), ["a", "b"])
+    assert_equal(len(od.keys()), len(od))
+    assert_raises(ValueError, odict, 1)
+    assert_raises(ValueError, odict, [], [], [])
+
+def testOrder():
+    keys = [5, 3, 9, 1, 7]
+    od = odict([(i, str(i)) for i in keys])
+    assert_equal(list(od), keys)
+    assert_equal(od.keys(), keys)
+    assert_equal(od.values(), [str(i) for i in keys])
+    assert_equal(list(reversed(od)), keys[::-1])
+    # Changing a value doesn't change the order
+    od[3] = "x"
+    assert_equal(od.keys(), keys)
+    # Deleting and adding back puts the key at the end
+    del od[3]
+    od[3] = "3"
+    assert_equal(od.keys(), [5, 9, 1, 7, 3])
+    assert_raises(KeyError, od.__delitem__, 3.5)
+    # Deleting everything leaves a usable empty odict
+    for i in keys:
+        del od[i]
+    assert_equal(od.keys(), [])
+    od[1] = 1
+    assert_equal(od.items(), [(1, 1)])
+
+def testPop():
+    od = odict([(i, i*i) for i in range(5)])
+    assert_equal(od.pop(2), 4)
+    assert_raises(KeyError, od.pop, 2)
+    assert_equal(od.pop(2, "x"), "x")
+    assert_equal(od.popitem(), (4, 16))
+    assert_equal(od.popitem(last=False), (0, 0))
+    assert_equal(od.keys(), [1, 3])
+    od.clear()
+    assert_raises(KeyError, od.popitem)
+    assert_equal(list(od), [])
+
+def testMoveToEnd():
+    od = odict([(i, None) for i in range(4)])
+    od.move_to_end(1)
+    assert_equal(od.keys(), [0, 2, 3, 1])
+    od.move_to_end(3, last=False)
+    assert_equal(od.keys(), [3, 0, 2, 1])
+    od.move_to_end(1)
+    assert_equal(od.keys(), [3, 0, 2, 1])
+    assert_equal(list(reversed(od)), [1, 2, 0, 3])
+    assert_raises(KeyError, od.move_to_end, 9)
+
+def testViews():
+    od = odict([("a", 1), ("b", 2)])
+    k, v, i = od.viewkeys(), od.viewvalues(), od.viewitems()
+    assert_equal(list(k), ["a", "b"])
+    assert_equal(list(v), [1, 2])
+    assert_equal(list(i), [("a", 1), ("b", 2)])
+    assert("a" in k and "c" not in k)
+    assert(2 in v and 3 not in v)
+    assert(("b", 2) in i and ("b", 3) not in i)
+    assert("b" not in i and ("b", 2, 3) not in i and [] not in i)
+    assert(["b", 2] not in i)
+    # Views see later changes
+    od["c"] = 3
+    del od["a"]
+    assert_equal(len(k), 2)
+    assert_equal(list(k), ["b", "c"])
+    assert_equal(list(od.iteritems()), [("b", 2), ("c", 3)])
+
+def testCopy():
+    od = odict([(3, "c"), (1, "a"), (2, "b")])
+    for new in (od.copy(), copy.copy(od), copy.deepcopy(od),
+                pickle.loads(pickle.dumps(od, pickle.HIGHEST_PROTOCOL))):
+        assert_equal(new.items(), od.items())
+        assert(isinstance(new, odict))
+        del new[1]
+        assert_equal(od.keys(), [3, 1, 2])
+    assert_equal(repr(od), "odict{3: 'c', 1: 'a', 2: 'b'}")
+    assert(od == {1: "a", 2: "b", 3: "c"})
+
+if __name__ == "__main__":
+    run(globals())
@@ -0,0 +1,88 @@
+'''
+Compare the speed of odict with the earlier implementation that kept
+the keys in a list.  Usage:
+
+    python odict_timing.py [n1 [n2 ...]]
+
+where the n's are the numbers of keys (the default is 1e5 and 1e6).
+The old implementation's deletions take time proportional to the
+number of keys, so both implementations delete the same 2000 keys
+from the front and from the middle rather than all of them.
+'''
+
+from __future__ import print_function
+import sys
+import time
+from odict import odict
+
+class old_odict(dict):
+    '''The parts of the earlier odict that are timed.
+    '''
+    def __init__(self):
+        self._seq = []
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._seq.append(key)
+        dict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._seq.remove(key)
+    def __iter__(self):
+        return iter(self._seq)
+    def keys(self):
+        return self._seq[:]
+    def items(self):
+        return zip(self._seq, [self[i] for i in self._seq])
+
+def Time(f, *args):
+    '''Return the seconds it takes to call f(*args).
+    '''
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def Fill(od, keys):
+    for i in keys:
+        od[i] = i
+
+def Iterate(od):
+    for i in od:
+        pass
+
+def Items(od):
+    od.items()
+
+def Delete(od, keys):
+    for i in keys:
+        del od[i]
+
+def Compare(n, max_deletes=2000):
+    '''Print the times for n keys.
+    '''
+    keys = range(n)
+    print("%d keys" % n)
+    print("  %-26s %10s %10s" % ("", "old, s", "new, s"))
+    old, new = old_odict(), odict()
+    for name, f, args in (
+            ("Insert", Fill, (keys,)),
+            ("Iterate", Iterate, ()),
+            ("items()", Items, ())):
+        t = [Time(f, od, *args) for od in (old, new)]
+        print("  %-26s %10.3f %10.3f" % (name, t[0], t[1]))
+    # Both delete the same keys in the same order
+    m = min(n, max_deletes)
+    middle = keys[n//2 - m//2:][:m]
+    front = keys[:m] if m < n//2 - m//2 else []
+    for name, deleted in (("Delete %d middle" % m, middle),
+                          ("Delete %d first" % len(front), front)):
+        if deleted:
+            t = [Time(Delete, od, deleted) for od in (old, new)]
+            print("  %-26s %10.3f %10.3f" % (name, t[0], t[1]))
+
+def main():
+    sizes = [int(float(i)) for i in sys.argv[1:]] or [int(1e5), int(1e6)]
+    for n in sizes:
+        Compare(n)
+
+if __name__ == "__main__":
+    main()
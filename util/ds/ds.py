@@ -10,10 +10,57 @@ Example:
   string 3456.
 '''
 
-import sys, os, getopt, re, glob, subprocess
+import sys, os, getopt, re, subprocess
+import cPickle as pickle
+import sre_parse
+import sre_constants as sre
+from bisect import bisect_right
 from os.path import join, isfile, split 
 import color as c
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir  # Backport for python 2
+    except ImportError:
+        scandir = None
+
+# The directories to search are listed one per line in the config
+# file.  Blank lines and lines starting with '#' are ignored.  If the
+# config file doesn't exist, the default directories are used.
+config_file = join(os.path.expanduser("~"), ".ds")
+default_root = "/manuals"
+default_dirs = (
+    "datasheets",
+    "datasheets/batteries",
+    "app_notes",
+    "app_notes/Tektronix",
+    "catalogs",
+    "manuals",
+    "manuals/RadioShack",
+    "manuals/agilent",
+    "manuals/bk",
+    "manuals/bk/dc_load",
+    "manuals/bk/dmm",
+    "manuals/bk/function_generators",
+    "manuals/bk/misc",
+    "manuals/bk/power_supplies",
+    "manuals/bk/scopes",
+    "manuals/calculators",
+    "manuals/fluke",
+    "manuals/Dixon_lawn_mower_ZTR3362",
+    "manuals/gr",
+    "manuals/hp",
+    "manuals/tek",
+)
+
+# The file names in each directory are kept in the index file along
+# with the directory's modification time.  A directory is only read
+# again when its modification time changes.
+index_file = join(os.path.expanduser("~"), ".ds_index")
+index_version = 2
+
 # app to open a file with registered application
 if 1:
     app = "/usr/bin/exo-open"       # Linux
@@ -76,19 +123,28 @@ Usage:  {name} [options] regexp
   regexp.  Otherwise print out the matches and choose which one to
   display.
 
+  The directories to search are listed one per line in {config_file};
+  if it doesn't exist, directories under {default_root} are searched.
+  The file names are kept in {index_file} and a directory is only read
+  again when its modification time changes.
+
 Options
     -i  
         Make the search case sensitive.
+    -r
+        Rebuild the index from scratch.
 '''[1:-1]
-    out(s.format(**locals()))
+    out(s.format(name=name, config_file=config_file, index_file=index_file,
+                 default_root=default_root))
     sys.exit(status)
 
 def ParseCommandLine(d):
     d["-i"] = False     # If True, then case-sensitive search
+    d["-r"] = False     # If True, rebuild the index
     if len(sys.argv) < 2:
         Usage(d)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "i")
+        optlist, args = getopt.getopt(sys.argv[1:], "ir")
     except getopt.GetoptError as e:
         msg, option = e
         out(msg)
@@ -96,6 +152,8 @@ def ParseCommandLine(d):
     for opt in optlist:
         if opt[0] == "-i":
             d["-i"] = True
+        if opt[0] == "-r":
+            d["-r"] = True
     if len(args) != 1:
         Usage(d)
     return args
@@ -122,63 +180,174 @@ def Normalize(dir):
 def J(D, other):
     return Normalize(join(D, other))
 
+def GetDirectories(d):
+    '''Set d["root"] and d["dir"] from the config file or from the
+    default directories.  d["root"] is only used to shorten the names
+    that are printed.
+    '''
+    try:
+        lines = open(config_file).readlines()
+    except IOError:
+        d["root"] = default_root
+        d["dir"] = tuple(J(default_root, i) for i in default_dirs)
+        return
+    dirs = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            dirs.append(Normalize(os.path.expanduser(line)))
+    if not dirs:
+        out("No directories in '%s'" % config_file)
+        exit(1)
+    d["dir"] = tuple(dirs)
+    prefix = os.path.commonprefix([i + "/" for i in dirs])
+    d["root"] = prefix[:prefix.rfind("/")]
+
+def ListDirectory(dir):
+    '''Return a sorted list of the names of the files in dir.  Names
+    starting with '.' are skipped, as glob() did (this also leaves out
+    the ._name and .DS_Store files a Mac puts on network drives).
+    '''
+    if scandir is not None:
+        try:
+            return sorted(i.name for i in scandir(dir)
+                          if i.name[0] != "." and i.is_file())
+        except OSError:
+            return []
+    try:
+        names = os.listdir(dir)
+    except OSError:
+        return []
+    return sorted(i for i in names
+                  if i[0] != "." and isfile(join(dir, i)))
+
+def LoadIndex(d):
+    '''Return the index dictionary keyed by directory with values of
+    (mtime, list_of_file_names).
+    '''
+    if not d["-r"]:
+        try:
+            with open(index_file, "rb") as f:
+                version, index = pickle.load(f)
+            if version == index_version:
+                return index
+        except Exception:
+            pass
+    return {}
+
+def SaveIndex(index):
+    tmp = index_file + ".%d" % os.getpid()
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump((index_version, index), f, pickle.HIGHEST_PROTOCOL)
+        if sys.platform == "win32" and os.path.exists(index_file):
+            os.remove(index_file)
+        os.rename(tmp, index_file)
+    except (IOError, OSError) as e:
+        out("Couldn't write index '%s':  %s" % (index_file, e),
+            stream=sys.stderr)
+
 def GetFiles(d):
-    '''Get a list of files to display.
+    '''Return (names, paths) where names is a list of the file names
+    to search and paths is the corresponding list of full paths.  Only
+    the directories whose modification times changed since the index
+    was written are read.
     '''
-    files = []
+    old, index, changed = LoadIndex(d), {}, False
+    names, paths = [], []
     for dir in d["dir"]:
-        f = [Normalize(i) for i in glob.glob(dir + "/*")]
-        for file in f:
-            if isfile(file):
-                files.append(file)
-    return files
+        try:
+            mtime = os.stat(dir).st_mtime
+        except OSError:
+            continue
+        entry = old.get(dir)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, ListDirectory(dir))
+            changed = True
+        index[dir] = entry
+        names.extend(entry[1])
+        paths.extend(J(dir, i) for i in entry[1])
+    if changed or len(index) != len(old):
+        SaveIndex(index)
+    return names, paths
+
+def SeesOtherNames(items):
+    '''Return True if the parsed regular expression items contain a
+    \\A or \\Z anchor or a lookahead or lookbehind.  These can behave
+    differently when the names are joined with newlines, as they can
+    look past the end of a name.
+    '''
+    for op, av in items:
+        if op in (sre.ASSERT, sre.ASSERT_NOT):
+            return True
+        if op == sre.AT and av in (sre.AT_BEGINNING_STRING,
+                                   sre.AT_END_STRING):
+            return True
+        for i in (av if isinstance(av, (tuple, list)) else (av,)):
+            if isinstance(i, list):
+                # A list of subpatterns, as in a branch
+                if any(SeesOtherNames(j) for j in i):
+                    return True
+            elif isinstance(i, sre_parse.SubPattern) and SeesOtherNames(i):
+                return True
+    return False
+
+def FindMatches(r, names, paths):
+    '''Return a list of (full_filename, start, end) for the file names
+    matched by the compiled regular expression r; start and end locate
+    the match in the file name.  The names are joined into one string
+    with newlines so that a single finditer() call finds the matches.
+    If r could see past the end of a name, each name is searched by
+    itself.
+    '''
+    if SeesOtherNames(sre_parse.parse(r.pattern, r.flags)):
+        matches = []
+        for name, path in zip(names, paths):
+            mo = r.search(name)
+            if mo:
+                matches.append((path, mo.start(), mo.end()))
+        return matches
+    buffer = "\n".join(names)
+    starts, pos = [], 0
+    for name in names:
+        starts.append(pos)
+        pos += len(name) + 1
+    matches, last = [], -1
+    for mo in r.finditer(buffer):
+        line = bisect_right(starts, mo.start()) - 1
+        if line <= last:
+            continue        # Only the first match in a name is used
+        if "\n" in mo.group():
+            # The match spans names, so search them separately
+            end = bisect_right(starts, mo.end()) - 1
+            for i in range(line, end + 1):
+                m = r.search(names[i])
+                if m:
+                    matches.append((paths[i], m.start(), m.end()))
+            last = end
+            continue
+        begin = starts[line]
+        matches.append((paths[line], mo.start() - begin, mo.end() - begin))
+        last = line
+    return matches
 
 def main():
     d = {} # Options dictionary
-    d["root"] = D = "/manuals"
-    # Directories to check
-    d["dir"] = (
-        J(D, "datasheets"),
-        J(D, "datasheets/batteries"),
-        J(D, "app_notes"),
-        J(D, "app_notes/Tektronix"),
-        J(D, "catalogs"),
-        J(D, "manuals"),
-        J(D, "manuals/RadioShack"),
-        J(D, "manuals/agilent"),
-        J(D, "manuals/bk"),
-        J(D, "manuals/bk/dc_load"),
-        J(D, "manuals/bk/dmm"),
-        J(D, "manuals/bk/function_generators"),
-        J(D, "manuals/bk/misc"),
-        J(D, "manuals/bk/power_supplies"),
-        J(D, "manuals/bk/scopes"),
-        J(D, "manuals/calculators"),
-        J(D, "manuals/fluke"),
-        J(D, "manuals/Dixon_lawn_mower_ZTR3362"),
-        J(D, "manuals/gr"),
-        J(D, "manuals/hp"),
-        J(D, "manuals/tek"),
-    )
     regexp = ParseCommandLine(d)[0]
-    r = re.compile(regexp) if d["-i"] else re.compile(regexp, re.I)
+    GetDirectories(d)
+    flags = re.M if d["-i"] else re.M | re.I
+    r = re.compile(regexp, flags)
     # Get list of data files
-    files = GetFiles(d)
-    matches = []
-    for i in files:
-        # Only search for match in file name
-        dir, file = split(i)
-        mo = r.search(file)
-        if mo:
-            matches.append((i, mo))
-    # Each match item will be (full_filename, match_object) where
-    # match_object is the mo for _only_ the actual file name (not the
+    names, paths = GetFiles(d)
+    # Each match item will be (full_filename, start, end) where start
+    # and end locate the match in _only_ the actual file name (not the
     # path).
+    matches = FindMatches(r, names, paths)
     if len(matches) > 1:
         out("Choose which file to open:")
         for num, data in enumerate(matches):
-            file, mo = data
-            PrintMatch(num + 1, file, mo.start(), mo.end(), d)
+            file, start, end = data
+            PrintMatch(num + 1, file, start, end, d)
         # Get which one to open
         while True:
             answer = raw_input("? ").strip()
@@ -16,9 +16,17 @@ ANY KIND. See http://www.dspguru.com/wide-open-license for more
 information.
 '''
 
-import sys, os, getopt, functools, time, glob
+import sys, os, getopt, functools, time, stat, multiprocessing
 from collections import defaultdict
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # Backport for python 2
+    except ImportError:
+        scandir = None
+
 
 def StreamOut(streams, *s, **kw):
     k = kw.setdefault
@@ -85,12 +93,20 @@ Usage:  {name} [options] dir1 [dir2...]
 Options:
 {ci}
 {col}
+    -b 
+        Sort the output by the total bytes of the files.  Implies -l.
     -f 
         Consider the strings input on the command line as the file list
         itself and print the report for that set.
     -h 
         Include Mercurial directories (by default, directories with the
         name '.hg' are skipped.
+    -j num
+        Use num processes to scan the subdirectories of each directory
+        in parallel (only used with -r).
+    -l 
+        Long report:  for each extension, also print the total size of
+        the files in MB and the largest file.
     -r 
         Recurse into each directory given.
     -s 
@@ -101,21 +117,27 @@ Options:
     sys.exit(status)
 
 def ParseCommandLine(d):
+    d["-b"] = False     # Sort output by bytes
     d["-c"] = True      # Extension names are case-sensitive
     d["-C"] = False     # Print in columns
     d["-f"] = False     # Command line contains files
     d["-h"] = False     # Include .hg directories
+    d["-j"] = 1         # Number of processes
+    d["-l"] = False     # Long report
     d["-r"] = False     # Recurse into directories
     d["-s"] = False     # Sort output by counts
     if len(sys.argv) < 2:
         Usage(d)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "Ccfhrs")
+        optlist, args = getopt.getopt(sys.argv[1:], "bCcfhj:lrs")
     except getopt.GetoptError as str:
         msg, option = str
         out(msg)
         sys.exit(1)
     for opt in optlist:
+        if opt[0] == "-b":
+            d["-b"] = not d["-b"]
+            d["-l"] = True
         if opt[0] == "-c":
             d["-c"] = not d["-c"]
         if opt[0] == "-C":
@@ -124,6 +146,16 @@ def ParseCommandLine(d):
             d["-f"] = not d["-f"]
         if opt[0] == "-h":
             d["-h"] = not d["-h"]
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                out("'%s' is not a valid number of processes" % opt[1])
+                sys.exit(1)
+        if opt[0] == "-l":
+            d["-l"] = not d["-l"]
         if opt[0] == "-r":
             d["-r"] = not d["-r"]
         if opt[0] == "-s":
@@ -200,43 +232,40 @@ def ListInColumns(list, col_width=0, num_columns=0, space_betw=0, truncate=0):
     assert(len(lines) == num_rows)
     return lines
 
-def Reverse(seq):
-    '''seq is a list of [a, b] type pairs.  Turn each pair into the form
-    [b, a].
+def NewItem():
+    '''Return the census for an extension:  [count, bytes, size of the
+    largest file, name of the largest file].
     '''
-    for i in xrange(len(seq)):
-        a, b = seq[i]
-        seq[i] = [b, a]
-    return seq
+    return [0, 0, -1, ""]
 
 def PrintReport(data, d):
-    '''data is the defaultdict of counts; d is the options dict.
+    '''data is the defaultdict of census items; d is the options dict.
     '''
     if "" in data:
         del data[""]
-    v = data.values()
-    if not v:
+    if not data:
         # No information to report
         return
-    widest_integer = max([len(str(i)) for i in v])
-    fmt = "%*d %s"
-    items = Reverse([list(i) for i in data.items()])
-    if d["-s"]:
-        # Sort by count.  
-        items.sort()
-    else:
-        # Sort by extension.
-        Reverse(items)
-        # We want to sort by the extension, but have the sort be
-        # case-insensitive.  To do this, decorate the list with the
-        # lower case extension, sort, then remove it.
-        items = [[i[0].lower()] + i for i in items]
-        items.sort()
-        items = [i[1:] for i in items]
-        Reverse(items)
+    items = data.items()
+    # We want to sort by the extension, but have the sort be
+    # case-insensitive.
+    items.sort(key=lambda x: (x[0].lower(), x[0]))
+    if d["-b"]:
+        items.sort(key=lambda x: x[1][1])
+    elif d["-s"]:
+        items.sort(key=lambda x: x[1][0])
+    widest_integer = max([len(str(i[0])) for i in data.values()])
     output_data = []
-    for i in items:
-        output_data.append(fmt % tuple([widest_integer] + i))
+    if d["-l"]:
+        widest_ext = max([len(i) for i in data])
+        fmt = "%*d %10.1f %-*s %s"
+        for ext, (count, bytes, size, file) in items:
+            output_data.append(fmt % (widest_integer, count, bytes/1e6,
+                                      widest_ext, ext, file))
+    else:
+        fmt = "%*d %s"
+        for ext, (count, bytes, size, file) in items:
+            output_data.append(fmt % (widest_integer, count, ext))
     if d["-C"]:
         for i in ListInColumns(output_data):
             out(i.rstrip())
@@ -247,42 +276,130 @@ def PrintReport(data, d):
 def NormalizePath(path):
     return path.replace("\\", "/")
 
-def ProcessDirectory(dir, data, d):
-    assert os.path.isdir(dir)
+def ListDirectory(dir):
+    '''Return (files, dirs) where files is a list of (name, size) of
+    the files in dir and dirs is a list of the names of its
+    subdirectories.  Each file is stat'ed once; symbolic links to
+    directories are not followed.
+    '''
+    files, dirs = [], []
+    try:
+        if scandir is not None:
+            for entry in scandir(dir):
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append((entry.name, entry.stat().st_size))
+                except OSError:
+                    pass
+        else:
+            for name in os.listdir(dir):
+                path = os.path.join(dir, name)
+                try:
+                    st = os.lstat(path)
+                    if stat.S_ISDIR(st.st_mode):
+                        dirs.append(name)
+                        continue
+                    if stat.S_ISLNK(st.st_mode):
+                        st = os.stat(path)
+                    if stat.S_ISREG(st.st_mode):
+                        files.append((name, st.st_size))
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return files, dirs
+
+def Classify(name, path, size, data, d):
+    '''Add the file to the census of its extension in data.
+    '''
+    ext = os.path.splitext(name)[1]
+    if ext:
+        if not d["-c"]:
+            ext = ext.lower()
+        item = data[ext]
+        item[0] += 1
+        item[1] += size
+        if size > item[2]:
+            item[2], item[3] = size, path
+
+def ClassifyFiles(dir, files, data, d):
+    '''Classify the (name, size) pairs of the files in dir.
+    '''
+    for name, size in files:
+        # Like a glob of '*', skip the hidden files
+        if not name.startswith("."):
+            Classify(name, dir + "/" + name, size, data, d)
+
+def ProcessDirectory(dir, data, d, recurse=False):
+    '''Classify the files in dir and, if recurse is True, the files in
+    the directories below it.  Each directory is listed once.
+    '''
+    stack = [NormalizePath(dir)]
+    while stack:
+        dir = stack.pop()
+        if os.path.split(dir)[1] == ".hg" and not d["-h"]:
+            # Ignore Mercurial directories
+            continue
+        files, dirs = ListDirectory(dir)
+        ClassifyFiles(dir, files, data, d)
+        if recurse:
+            stack.extend([dir + "/" + i for i in reversed(dirs)])
+
+def ScanTree(args):
+    '''Worker for the -j option:  return the census of the tree at dir.
+    '''
+    dir, d = args
+    data = defaultdict(NewItem)
+    ProcessDirectory(dir, data, d, recurse=True)
+    return dict(data)
+
+def ParallelProcessDirectory(dir, data, d):
+    '''Same as ProcessDirectory with recurse True, but each
+    subdirectory of dir is processed by a pool of processes and the
+    results are merged into data.  dir itself is only listed once.
+    '''
+    dir = NormalizePath(dir)
     if os.path.split(dir)[1] == ".hg" and not d["-h"]:
-        # Ignore Mercurial directories
         return
-    dir = NormalizePath(dir)
-    ProcessFiles(glob.glob(dir + "/*"), data, d)
+    files, dirs = ListDirectory(dir)
+    ClassifyFiles(dir, files, data, d)
+    pool = multiprocessing.Pool(d["-j"])
+    try:
+        results = pool.map(ScanTree, [(dir + "/" + i, d) for i in dirs])
+    finally:
+        pool.close()
+        pool.join()
+    for result in results:
+        for ext, (count, bytes, size, file) in result.items():
+            item = data[ext]
+            item[0] += count
+            item[1] += bytes
+            if size > item[2]:
+                item[2], item[3] = size, file
 
 def ProcessFiles(files, data, d):
     '''For each file in the list files, classify the extension into
     the data container.
     '''
     for file in files:
-        if os.path.isfile(file):
-            name, ext = os.path.splitext(file)
-            if ext:
-                if not d["-c"]:
-                    ext = ext.lower()
-                data[ext] += 1
+        try:
+            st = os.stat(file)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            Classify(file, file, st.st_size, data, d)
 
 if __name__ == "__main__":
     d = {} # Options dictionary
-    items, data = ParseCommandLine(d), defaultdict(int)
+    items, data = ParseCommandLine(d), defaultdict(NewItem)
     for item in items:
         if os.path.isdir(item):
-            if d["-r"]:
-                # Process directories recursively
-                for directory, dirnames, files in os.walk(item):
-                    directory = NormalizePath(directory)
-                    # Don't process Mercurial directories unless -h
-                    # was used on command line
-                    if "/.hg" in directory and not d["-h"]:
-                        continue
-                    ProcessDirectory(directory, data, d)
+            if d["-r"] and d["-j"] > 1:
+                ParallelProcessDirectory(item, data, d)
             else:
-                ProcessDirectory(item, data, d)
+                ProcessDirectory(item, data, d, recurse=d["-r"])
         else:
             ProcessFiles([item], data, d)
     PrintReport(data, d)
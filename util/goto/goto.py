@@ -22,7 +22,10 @@ information.
 import sys
 import getopt
 import os
+import marshal
+import re
 from collections import OrderedDict
+from multiprocessing.dummy import Pool as ThreadPool
 
 #xx
 from pdb import set_trace as xx #xx
@@ -49,9 +52,18 @@ max_num_width = 2       # Maximum width of prompt numbers
 max_alias_width = 8     # Maximum width of aliases
 nl = "\n"
 
+# The parsed goto file is kept in a file with this suffix next to it.
+# It is used as long as the goto file's size and modification time
+# haven't changed.
+cache_suffix = ".cache"
+cache_version = 1
+
+# Maximum number of fuzzy matches shown when the choice is ambiguous
+max_fuzzy = 10
+
 def Usage():
     name = sys.argv[0]
-    err('''Usage:  %(name)s [-c] [-t] goto_file  num_or_alias
+    err('''Usage:  %(name)s [-c] [-j num] [-t] goto_file  num_or_alias
   Prints a list of directory choices read from the goto_file and
   prompts you to pick one (set num_or_alias to 0 to be prompted;
   otherwise, the translation of the number or alias is made directly).
@@ -71,13 +83,24 @@ def Usage():
   directories.  You can also pass the choice number (> 0) on the
   command line and go to that choice immediately.
 
+  If num_or_alias isn't a number or alias, it's used as a fuzzy
+  search:  its characters must appear in order in an alias, a name
+  or a component of a path.  The best match is chosen; if there's a
+  tie, the best matches are listed for you to pick one.
+
+  The parsed goto_file is kept in goto_file%(cache_suffix)s so that
+  it doesn't have to be parsed every time.
+
 Options
   -c
     Changes the cygwin form of a path to a Windows style path.  For
     example, /cygdrive/c/something --> c:/something.
+  -j num
+    Use num threads to check the paths with -t (helps when they are on
+    network mounts).
   -t
     Print out files in the config file that don't exist.
-''' % locals())
+''' % dict(locals(), cache_suffix=cache_suffix))
     exit(1)
 
 def FixPath(path, d):
@@ -184,31 +207,48 @@ def PrintAlias(alias_tuple):
         Error("Alias '%s' is longer than %d characters" % (alias, maxlen))
     err("%-8s %s\n" % alias_tuple)
 
-def CheckFiles(od):
+def CheckFiles(od, numthreads=1):
     '''od is an ordered dictionary with values (msg, filename).  Check
-    that each filename item is a valid file.
+    that each filename item exists.  The checks are made by numthreads
+    threads; the missing files are reported in order.
     '''
+    filenames = [filename for msg, filename in od.values() if filename]
+    if numthreads > 1:
+        pool = ThreadPool(numthreads)
+        try:
+            exists = pool.map(os.path.exists, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        exists = [os.path.exists(i) for i in filenames]
     bad = False
-    for msg, filename in od.values():
-        if not filename:
-            continue
-        if not os.path.isfile(filename):
+    for filename, ok in zip(filenames, exists):
+        if not ok:
             err("'%s' doesn't exist%s" % (filename, nl))
             bad = True
     return bad
 
 def ParseCommandLine(d):
     d["-c"] = False     # Convert cygwin-style paths to Windows-style
+    d["-j"] = 1         # Number of threads for -t
     d["-t"] = False     # Check paths
     d["prompt_func"] = input if sys.version_info[0] >= 3 else raw_input
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "ct")
+        optlist, args = getopt.getopt(sys.argv[1:], "cj:t")
     except getopt.GetoptError as e:
         msg, option = e
         Error(msg)
     for opt in optlist:
         if opt[0] == "-c":
             d["-c"] = True
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                Error("'%s' is not a valid number of threads" % opt[1])
         if opt[0] == "-t":
             d["-t"] = True
     if d["-t"]:
@@ -278,7 +318,8 @@ def GetDict(goto_file):
                 msg += "  '%s'" % Line
                 Error(msg % (linenum + 1, goto_file))
         else:
-            Error("Too many fields on line %d in '%s'" % (i + 1, goto_file))
+            Error("Too many fields on line %d in '%s'" %
+                  (linenum + 1, goto_file))
     od, choice = OrderedDict(), 0
     # Construct numbered items
     for i, (name, path) in enumerate(numbered):
@@ -294,6 +335,96 @@ def GetDict(goto_file):
         od[alias] = (msg, path)
     return od
 
+def LoadDict(goto_file):
+    '''Return the ordered dictionary made by GetDict().  It's read
+    from the cache file next to goto_file with one read if the cache
+    was made from the current goto_file; otherwise goto_file is parsed
+    and the cache is written.  Failure to write the cache isn't an
+    error.
+    '''
+    try:
+        st = os.stat(goto_file)
+    except OSError:
+        Error("Can't read '%s'" % goto_file)
+    stamp = (cache_version, st.st_size, st.st_mtime)
+    cache_file = goto_file + cache_suffix
+    try:
+        with open(cache_file, "rb") as f:
+            cached_stamp, items = marshal.loads(f.read())
+        if cached_stamp == stamp:
+            return OrderedDict(items)
+    except Exception:
+        pass
+    od = GetDict(goto_file)
+    try:
+        with open(cache_file, "wb") as f:
+            f.write(marshal.dumps((stamp, list(od.items()))))
+    except (IOError, OSError):
+        pass
+    return od
+
+def Score(query, s):
+    '''Return a score for how well the characters of query match the
+    string s in order (a subsequence match), or 0 if they don't all
+    appear.  Matches at the start of s or of a word in s and runs of
+    consecutive matching characters score higher.  The comparison is
+    case-insensitive.
+    '''
+    s, score, pos, last = s.lower(), 0, 0, -2
+    for c in query.lower():
+        loc = s.find(c, pos)
+        if loc == -1:
+            return 0
+        points = 1
+        if loc == 0 or not s[loc - 1].isalnum():
+            points += 3     # Start of a word
+        if loc == last + 1:
+            points += 2     # Consecutive
+        score += points
+        last, pos = loc, loc + 1
+    if s == query.lower():
+        score += 10
+    return score
+
+def FuzzyMatch(query, od):
+    '''Return a list of (score, key) for the items in od that match
+    query, best first.  The alias (for aliased items), the name and
+    each component of the path are scored and the best score is used.
+    score is a (Score(), -length) tuple, so a shorter string only wins
+    between equal Score() values.
+    '''
+    matches = []
+    for key, (msg, path) in od.items():
+        if not path:
+            continue
+        # msg is the number or alias followed by the name
+        number_or_alias, name = (msg.split(None, 1) + [""])[:2]
+        strings = [name] + [i for i in re.split(r"[/\\]", path) if i]
+        if not key.isdigit():
+            strings.append(key)
+        score = max([(Score(query, i), -len(i)) for i in strings])
+        if score[0] > 0:
+            matches.append((score, key))
+    matches.sort(key=lambda x: x[0], reverse=True)
+    return matches
+
+def Prompt(od, d):
+    '''Print the choices in od and return the path the user selects.
+    We print messages to stderr because the selected directory will be
+    printed to stdout.
+    '''
+    for prompt_string, path in od.values():
+        err(prompt_string + nl)
+    err("Selection? ")
+    while True:
+        selection = d["prompt_func"]().strip()
+        if selection in od:
+            msg, path = od[selection]
+            return path
+        else:
+            msg = "'%s' is not valid choice.  Try again.%s"
+            err(msg % (selection, nl))
+
 def main():
     d = {}  # Options dictionary
     # choice is the number/alias the user supplied on the command line
@@ -301,30 +432,29 @@ def main():
     goto_file, choice = ParseCommandLine(d)
     # Construct an ordered dictionary of choices.  The keys will be
     # the allowed strings the user can type in at the command line.
-    od = GetDict(goto_file)
+    od = LoadDict(goto_file)
     if d["-t"]:
-        exit(CheckFiles(od))
+        exit(CheckFiles(od, d["-j"]))
     if choice == "0":
-        # Prompt the user for the desired choice.  We print messages
-        # to stderr because the selected directory will be printed to
-        # stdout.  
-        for prompt_string, path in od.values():
-            err(prompt_string + nl)
-        err("Selection? ")
-        while True:
-            selection = d["prompt_func"]().strip()
-            if selection in od:
-                msg, path = od[selection]
-                out(FixPath(path, d) + nl)
-                break
-            else:
-                msg = "'%s' is not valid choice.  Try again.%s"
-                err(msg % (selection, nl))
+        out(FixPath(Prompt(od, d), d) + nl)
+    elif choice in od:
+        msg, path = od[choice]
+        out(FixPath(path, d) + nl)
+    elif choice.isdigit():
+        Error("'%s' is not a valid choice" % choice)
     else:
-        if choice in od:
-            msg, path = od[choice]
-            out(FixPath(path, d) + nl)
-        else:
+        # Numbers aren't fuzzy matched, as they'd match digits in paths
+        matches = FuzzyMatch(choice, od)
+        if not matches:
             Error("'%s' is not a valid choice" % choice)
+        best = [key for score, key in matches if score == matches[0][0]]
+        if len(best) == 1:
+            msg, path = od[best[0]]
+        else:
+            # Ambiguous, so let the user pick from the best matches
+            choices = OrderedDict([(key, od[key]) for score, key in
+                                   matches[:max_fuzzy]])
+            choices[""] = ("", "")
+            path = Prompt(choices, d)
+        out(FixPath(path, d) + nl)
 main()
-
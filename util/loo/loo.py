@@ -7,7 +7,9 @@ Run as a script to pass OO files on the command line; their picture
 files will be printed to stdout.  Missing image files and image files
 that aren't relative to the document's location will be flagged.
  
-This is done by a heuristic rather than parsing the XML.
+This is done by a heuristic rather than parsing the XML:  the image
+tags are found with a regular expression while the document's
+content.xml is decompressed a chunk at a time.
 '''
 
 # Copyright (C) 2014 Don Peterson
@@ -20,7 +22,13 @@ from __future__ import (absolute_import, division, print_function)
 import sys
 import getopt
 import os
+import re
 import zipfile
+import multiprocessing
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from pdb import set_trace as xx
 
@@ -75,6 +83,18 @@ except ImportError:
 
 class ZipfileError(Exception): pass
 
+# An image tag and the link in it.  The lookahead keeps tags like
+# <draw:image-map> from matching.  The XML members of a document are
+# read in chunks of _chunk_size bytes.
+_image_tag = re.compile(br"<draw:image(?=[\s/>])[^>]*>")
+_href = re.compile(br'\bxlink:href="([^"]*)"')
+_chunk_size = 1 << 16
+
+# The links found in each document are kept in this file, keyed by the
+# document's path.  A document is only read again if its size or
+# modification time changed.
+cache_file = os.path.join(os.path.expanduser("~"), ".loo_cache")
+
 def Usage(d, status=1):
     def remove(alist, chars="[]'"):
         alist.sort()
@@ -86,6 +106,7 @@ def Usage(d, status=1):
     notrel = notrel_image
     image_extensions = _raw_ext
     oo_extensions = remove(list(_oo_ext))
+    cache_file = globals()["cache_file"]
     out('''
 Usage:  {name} [options] file1 [file2...]
   For each Open Office document file given on the command line, print
@@ -104,8 +125,17 @@ Usage:  {name} [options] file1 [file2...]
     {oo_extensions}
   
 Options
+  -c
+    Don't use the cache of the links found in each document (kept in
+    {cache_file}).  Normally a document is only read if its size
+    or modification time changed since it was last read.
   -e 
     Also print the names of embedded image files.
+  -j num
+    Use num processes to read the documents.
+  -s
+    Also search the document's styles.xml (images in headers, footers
+    and page backgrounds are stored there).
   -l
     Just list the encountered Open Office files (i.e., don't list
     their image files).
@@ -128,21 +158,34 @@ Examples
     exit(status)
 
 def ParseCommandLine(d):
+    d["-c"] = False     # Don't use the cache
     d["-e"] = False     # Don't ignore embedded pictures
+    d["-j"] = 1         # Number of processes
     d["-l"] = False     # Only list OO file names
     d["-m"] = False     # Missing pictures only
     d["-r"] = False     # Recursive search
+    d["-s"] = False     # Also search styles.xml
     if len(sys.argv) < 2:
         Usage(d)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "elmr")
+        optlist, args = getopt.getopt(sys.argv[1:], "cej:lmrs")
     except getopt.GetoptError as e:
         msg, option = e
         out(msg)
         exit(1)
     for opt in optlist:
+        if opt[0] == "-c":
+            d["-c"] = True
         if opt[0] == "-e":
             d["-e"] = True
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                out("'%s' is not a valid number of processes%s" % (opt[1], nl))
+                exit(1)
         if opt[0] == "-l":
             d["-l"] = True
             d["-r"] = True  # Implies a recursive search
@@ -150,6 +193,8 @@ def ParseCommandLine(d):
             d["-m"] = True
         if opt[0] == "-r":
             d["-r"] = True
+        if opt[0] == "-s":
+            d["-s"] = True
     if d["-r"]:
         if not args:
             args = ["."]
@@ -158,19 +203,17 @@ def ParseCommandLine(d):
         Usage(d)
     return args
 
-def _Extract(filename, s):
-    '''_Extract the image tag at the beginning of the string s.
+def _Extract(filename, tag):
+    '''Return the picture file linked to in the image tag or None if
+    it isn't a picture file.  A tag without a link holds an image
+    stored as office:binary-data in the XML, so it is skipped.
     '''
-    k = "href="
-    loc = s.find(k)
-    if loc == -1:
-        raise ZipfileError("Missing href in '%s'" % filename)
-    start = loc + 1 + len(k)
-    s = s[start:]
-    end = s.find('"', 1)
-    if loc == -1:
-        raise ZipfileError("Missing ending quote in '%s'" % filename)
-    path = s[:end]
+    mo = _href.search(tag)
+    if mo is None:
+        return None
+    path = mo.group(1)
+    if not isinstance(path, str):
+        path = path.decode("utf-8")     # Python 3
     dir, file = os.path.split(path)
     name, ext = os.path.splitext(file)
     if ext in _picture_ext:
@@ -180,27 +223,39 @@ def _Extract(filename, s):
         return path
 
 def _ProcessZipObject(zipobj, filename):
-    '''zipobj is an open ZipFile object.  Open the file filename in
-    the zip archive, read in its bytes, and search them for image tags.
+    '''zipobj is an open ZipFile object.  Decompress the file filename
+    in the zip archive a chunk at a time and search the chunks for
+    image tags, so the whole file is never in memory.  The part of a
+    chunk after the last '<' that hasn't been closed is kept to be
+    searched with the next chunk.
     '''
-    s = zipobj.open(filename).read()
-    tag_begin, tag_end = "<draw:image xlink:href", "/>"
-    loc = s.find(tag_begin)
-    found_files = []
-    while loc != -1:
-        s = s[loc:]
-        end = s.find(tag_end)
-        if end == -1:
-            raise ZipfileError("No end for '%s'" % filename)
-        o = _Extract(filename, s[:end])
-        if o is not None:
-            if o.startswith("file:///"):
-                o = o[8:]
-            found_files.append(o)
-        s = s[end:]
-        loc = s.find("<draw:image xlink:href")
+    stream, found_files, tail = zipobj.open(filename), [], b""
+    while True:
+        chunk = stream.read(_chunk_size)
+        if not chunk:
+            break
+        s, end = tail + chunk, 0
+        for mo in _image_tag.finditer(s):
+            o = _Extract(filename, mo.group())
+            if o is not None:
+                if o.startswith("file:///"):
+                    o = o[8:]
+                found_files.append(o)
+            end = mo.end()
+        loc = s.rfind(b"<", end)
+        tail = s[loc:] if loc != -1 and s.find(b">", loc) == -1 else b""
+    if _image_tag.match(tail + b">"):
+        raise ZipfileError("No end for '%s'" % filename)
     return found_files
 
+def _XMLMembers(zipobj, styles=False):
+    '''Return the names of the XML files in the zip archive that can
+    have image links:  the content.xml files of the document and its
+    embedded objects and, if styles is True, the styles.xml files.
+    '''
+    names = ["content.xml"] + (["styles.xml"] if styles else [])
+    return [i for i in zipobj.namelist() if i.split("/")[-1] in names]
+
 def IsOOFile(file):
     '''Return True if file has the name of an Open Office document
     file.
@@ -209,11 +264,48 @@ def IsOOFile(file):
     name, ext = os.path.splitext(filename)
     return ext.lower() in _oo_ext
 
-def GetOOFilePictures(oofile):
+def GetLinks(oofile, styles=False):
+    '''Return a list of the picture files linked to in the given Open
+    Office file.  The paths are as they are in the document.
+    '''
+    # This is done by a heuristic that reads the XML text for the tag
+    # that precedes an image link.  The routine can't tell the
+    # difference between an embedded picture and a linked picture.
+    # The files are either relative to the Open Office file's location
+    # or will be absolute file system paths.
+    z, found_files = zipfile.ZipFile(oofile, "r"), []
+    try:
+        for i in _XMLMembers(z, styles):
+            found_files += _ProcessZipObject(z, i)
+    finally:
+        z.close()
+    return found_files
+
+def Classify(oofile, found_files):
+    '''Return a tuple of (path, state) for each of the picture files
+    found_files linked to in oofile (see GetOOFilePictures()).  The
+    relative paths are resolved against the directory oofile is in
+    rather than the current directory.
+    '''
+    found, base = [], os.path.dirname(oofile) or os.curdir
+    for file in found_files:
+        path = os.path.join(base, file)
+        if IsEmbeddedImage(file):
+            found.append((file, "embedded"))
+        elif not os.path.isfile(path):
+            found.append((file, "missing"))
+        else:
+            relpath = Normalize(os.path.relpath(path, base))
+            if os.path.isabs(relpath) or relpath.startswith(".."):
+                found.append((file, "notrel"))
+            else:
+                found.append((file, ""))
+    return tuple(found)
+
+def GetOOFilePictures(oofile, styles=False):
     '''Return a sequence of the picture files included in the given
-    Open Office file.  If oofile contains a path, it will be made the
-    current directory (and the old current directory will be restored
-    before exiting).
+    Open Office file.  If styles is True, the images in the document's
+    styles.xml are included.
     
     Each returned item is a tuple of the form
         (path, state)
@@ -226,38 +318,7 @@ def GetOOFilePictures(oofile):
     not at or below the directory containing the Open Office file.  An
     empty string means it's neither "missing" or "notrel".
     '''
-    olddir = os.getcwd()
-    path, file = os.path.split(oofile)
-    if path:
-        os.chdir(path)
-    try:
-        # This is done by a heuristic that reads the XML text for the tag
-        # that precedes an image link.  The routine can't tell the
-        # difference between an embedded picture and a linked picture.
-        # The files are either relative to the Open Office file's location
-        # or will be absolute file system paths.
-        z, found_files = zipfile.ZipFile(oofile, "r"), []
-        for i in z.namelist():
-            # Only search XML files
-            if i.lower().endswith(".xml"):
-                found_files += _ProcessZipObject(z, i)
-        # Examine each file and determine if it's OK, missing, not
-        # relative, or embedded.
-        found, currdir = [], Normalize(os.getcwd())
-        for file in found_files:
-            if IsEmbeddedImage(file):
-                found.append((file, "embedded"))
-            elif not os.path.isfile(file):
-                found.append((file, "missing"))
-            else:
-                relpath = Normalize(os.path.relpath(file, currdir))
-                if os.path.isabs(relpath) or relpath.startswith(".."):
-                    found.append((file, "notrel"))
-                else:
-                    found.append((file, ""))
-    finally:
-        os.chdir(olddir)
-    return tuple(found)
+    return Classify(oofile, GetLinks(oofile, styles))
 
 _all_chars = set([chr(i) for i in range(256)])
 
@@ -292,38 +353,123 @@ def IsEmbeddedImage(path):
         return True
     return False
 
-def GetImages(file, ignore_embedded=True):
-    olddir, image_files = os.getcwd(), []
-    path, name = os.path.split(file)
-    if path:
-        os.chdir(path)
+def _ReadLinks(args):
+    '''Return (links, error) for the Open Office file; this can be run
+    in a worker process.  error is None or a tuple whose first element
+    is the name of the exception.
+    '''
+    file, styles = args
     try:
+        return GetLinks(file, styles), None
+    except ZipfileError as e:
+        return [], ("ZipfileError", str(e))
+    except zipfile.BadZipfile:
+        return [], ("BadZipfile",)
+    except (IOError, OSError) as e:
+        return [], ("ZipfileError", str(e))
+
+def _Images(file, links, error, ignore_embedded):
+    '''Report the error from reading the file, if any, and return the
+    classified image files.
+    '''
+    if error and error[0] == "ZipfileError":
+        err("Error for file '%s':%s" % (os.path.dirname(file), nl))
+        err("  %s%s" % (error[1], nl))
+    elif error and not os.path.isdir(file):
+        err("Error:  '%s' is not an Open Office file%s" % (file, nl))
+    image_files = Classify(file, links)
+    # If d["-e"] is not set (i.e., ignore embedded images), then
+    # remove the embedded images.
+    if ignore_embedded:
+        non_embedded = []
+        for i in image_files:
+            name, state = i
+            if not (state == "missing" and IsEmbeddedImage(name)):
+                non_embedded.append(i)
+        image_files = non_embedded
+    return list(image_files)
+
+def GetImages(file, ignore_embedded=True, styles=False):
+    links, error = _ReadLinks((file, styles))
+    return _Images(file, links, error, ignore_embedded)
+
+def LoadCache():
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+        if isinstance(cache, dict):
+            return cache
+    except Exception:
+        pass
+    return {}
+
+def SaveCache(cache):
+    tmp = cache_file + ".%d" % os.getpid()
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        if sys.platform == "win32" and os.path.exists(cache_file):
+            os.remove(cache_file)
+        os.rename(tmp, cache_file)
+    except (IOError, OSError) as e:
+        err("Couldn't write cache '%s':  %s%s" % (cache_file, e, nl))
+
+def GetAllImages(oofiles, d):
+    '''Generator that yields (oofile, image_files) for each of the
+    Open Office files in the sequence oofiles, in the same order.  The
+    links of a document come from the cache if its size and
+    modification time haven't changed; the other documents are read
+    by a pool of d["-j"] processes.
+    '''
+    cache = {} if d["-c"] else LoadCache()
+    keys, misses, seen = [], [], set()
+    for file in oofiles:
         try:
-            image_files = GetOOFilePictures(name)
-        except ZipfileError as e:
-            err("Error for file '%s':%s" % (path, nl))
-            err("  %s%s" % (e, nl))
-            image_files = []
-        except zipfile.BadZipfile:
-            if not os.path.isdir(file):
-                err("Error:  '%s' is not an Open Office file%s" % (file, nl))
-            image_files = []
+            st = os.stat(file)
+            stamp = (st.st_size, st.st_mtime, d["-s"])
+        except OSError:
+            stamp = None
+        key = os.path.abspath(file)
+        keys.append((key, stamp))
+        entry = cache.get(key)
+        if (stamp is not None and (entry is None or entry[0] != stamp)
+                and key not in seen):
+            # A file given more than once is only read once
+            seen.add(key)
+            misses.append((key, (file, d["-s"])))
+    pool = multiprocessing.Pool(d["-j"]) if d["-j"] > 1 and misses else None
+    try:
+        args = [i[1] for i in misses]
+        results = pool.imap(_ReadLinks, args) if pool else \
+                  (_ReadLinks(i) for i in args)
+        # The results arrive in the order of misses; they are looked up
+        # by key because a file given more than once has one result.
+        results, read = enumerate(results), {}
+        for file, (key, stamp) in zip(oofiles, keys):
+            if stamp is None:
+                # Can't be read; ProcessFile() will report it
+                links, error = [], None
+            elif key in seen:
+                while key not in read:
+                    n, result = next(results)
+                    read[misses[n][0]] = result
+                links, error = read[key]
+                if error is None:
+                    cache[key] = (stamp, links)
+            else:
+                links, error = cache[key][1], None
+            yield file, _Images(file, links, error, not d["-e"])
     finally:
-        os.chdir(olddir)
-        # If d["-e"] is not set (i.e., ignore embedded images), then
-        # remove the embedded images.
-        if ignore_embedded:
-            non_embedded = []
-            for i in image_files:
-                name, state = i
-                if not (state == "missing" and IsEmbeddedImage(name)):
-                    non_embedded.append(i)
-            image_files = non_embedded
-        return image_files
-
-def ProcessFile(oofile, d):
+        if pool:
+            pool.close()
+            pool.join()
+    if misses and not d["-c"]:
+        SaveCache(cache)
+
+def ProcessFile(oofile, d, image_files=None):
     '''Print out any linked image files in the Open Office file 
-    oofile.  d is the options directory.
+    oofile.  d is the options directory.  image_files is the list
+    returned by GetImages() if it's already been gotten.
     '''
     if not os.path.isfile(oofile):
         err("'%s' is not a file%s" % (oofile, nl))
@@ -333,7 +479,9 @@ def ProcessFile(oofile, d):
         "notrel"   : (c.lwhite, c.magenta),
         "embedded" : c.lgreen,
     }
-    image_files = GetImages(oofile, ignore_embedded=not d["-e"])
+    if image_files is None:
+        image_files = GetImages(oofile, ignore_embedded=not d["-e"],
+                                styles=d["-s"])
     if not image_files and not d["-m"]:
         # List the file
         out("%s%s" % (oofile, nl))
@@ -384,10 +532,13 @@ def ProcessFile(oofile, d):
             c.normal()
         out(nl)
 
-def ProcessDirectory(directory, d):
+def FindOOFiles(directory):
+    '''Return a list of the Open Office files at and below directory.
+    '''
+    oofiles = []
     if not os.path.isdir(directory):
         err("'%s' is not a directory%s" % (directory, nl))
-        return
+        return oofiles
     # The loop will visit each directory in directory's tree
     for root, dirs, files in os.walk(directory):
         chunks = Normalize(root).split("/")
@@ -399,27 +550,34 @@ def ProcessDirectory(directory, d):
                 oofile = J(root, file)
                 if oofile[:2] == "./":  # Remove './' prefix
                     oofile = oofile[2:]
-                ProcessFile(oofile, d)
+                oofiles.append(oofile)
+    return oofiles
+
+def ProcessFiles(oofiles, d):
+    for oofile, image_files in GetAllImages(oofiles, d):
+        if os.path.isfile(oofile):
+            ProcessFile(oofile, d, image_files)
+        else:
+            err("'%s' is not a file%s" % (oofile, nl))
+
+def ProcessDirectory(directory, d):
+    ProcessFiles(FindOOFiles(directory), d)
 
 def SearchDirectories(directories, d):
+    oofiles = []
     for directory in directories:
-        ProcessDirectory(directory, d)
+        oofiles += FindOOFiles(directory)
+    ProcessFiles(oofiles, d)
 
 def main():
     d = {} # Options dictionary
     args = ParseCommandLine(d)
-    d["start_dir"] = os.getcwd()
     if d["-r"]:
-        #dirs = [Normalize(os.path.abspath(i)) for i in args]
         SearchDirectories(args, d)
     else:
         if not args:
             out("Need at least one Open Office file" + nl)
             exit(1)
-        try:
-            for file in args:
-                ProcessFile(file, d)
-        finally:
-            os.chdir(d["start_dir"])
+        ProcessFiles(args, d)
 if __name__ == "__main__": 
     main()
@@ -0,0 +1,79 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import zipfile
+import loo
+from loo import GetAllImages, GetLinks, GetOOFilePictures
+from lwtest import run, assert_equal
+
+content = '''<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content>
+<draw:frame><draw:image xlink:href="../pictures/linked.png"
+  xlink:type="simple"/></draw:frame>
+<draw:frame><draw:image draw:mime-type="image/png"><office:binary-data>
+iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk
+</office:binary-data></draw:image></draw:frame>
+<draw:frame><draw:image xlink:href="Pictures/10000000000000200000002000A1B2C3.png"/>
+<draw:image-map><draw:area-rectangle xlink:href="http://a.b/c.png"/>
+</draw:image-map></draw:frame>
+<draw:frame><draw:image xlink:href="notes.txt"/></draw:frame>
+</office:document-content>
+'''
+
+def MakeDocument(dir, name, content=content):
+    '''Write an Open Office document with the given content.xml.
+    '''
+    path = os.path.join(dir, name)
+    z = zipfile.ZipFile(path, "w")
+    z.writestr("mimetype", "application/vnd.oasis.opendocument.text")
+    z.writestr("content.xml", content)
+    z.close()
+    return path
+
+def testLinks():
+    dir = tempfile.mkdtemp()
+    try:
+        doc = MakeDocument(dir, "a.odt")
+        # The embedded image without a link and the image map are
+        # skipped, as is a link that isn't to a picture file.
+        expected = ["pictures/linked.png",
+                    "Pictures/10000000000000200000002000A1B2C3.png"]
+        assert_equal(GetLinks(doc), expected)
+        assert_equal(GetOOFilePictures(doc),
+                     (("pictures/linked.png", "missing"),
+                      ("Pictures/10000000000000200000002000A1B2C3.png",
+                       "embedded")))
+        # Tags that cross a chunk boundary are found
+        chunk_size = loo._chunk_size
+        try:
+            for loo._chunk_size in (7, 64, 65):
+                assert_equal(GetLinks(doc), expected)
+        finally:
+            loo._chunk_size = chunk_size
+    finally:
+        shutil.rmtree(dir)
+
+def testAllImages():
+    dir = tempfile.mkdtemp()
+    cache_file = loo.cache_file
+    try:
+        loo.cache_file = os.path.join(dir, "cache")
+        a = MakeDocument(dir, "a.odt")
+        b = MakeDocument(dir, "b.odt", content.replace("linked", "b"))
+        c = MakeDocument(dir, "c.odt", "<x/>")
+        # A file given more than once must not shift the links of the
+        # files after it.
+        files = [a, b, a, c, b, c]
+        expected = [(i, GetOOFilePictures(i)) for i in files]
+        for cache, j in ((True, 1), (False, 1), (False, 2), (True, 2)):
+            d = {"-c": not cache, "-e": True, "-j": j, "-s": False}
+            got = [(i, tuple(j)) for i, j in GetAllImages(files, d)]
+            assert_equal(got, expected)
+        assert(os.path.isfile(loo.cache_file))
+    finally:
+        loo.cache_file = cache_file
+        shutil.rmtree(dir)
+
+if __name__ == "__main__":
+    run(globals())
@@ -16,7 +16,10 @@ capabilities, try
         what's in the color module.
 '''
 
-import sys, re, os, getopt, subprocess, string
+import sys, re, os, getopt, subprocess, string, mmap, struct
+import sre_parse
+import sre_constants as sre
+from collections import OrderedDict
 
 # The following are non-standard python modules that can be gotten
 # from http://code.google.com/p/hobbyutil/; however, they should have
@@ -70,6 +73,24 @@ streams = {
 }
 streams["s"] = streams["a"]
 
+# The index.sense file is memory-mapped the first time it's needed (see
+# SenseIndex()).
+sense_index = None
+
+# Parsed data file lines keyed by (letter, offset).  The least recently
+# used ones are dropped when there are more than synset_cache_size.
+synset_cache = OrderedDict()
+synset_cache_size = 5000
+
+# mkwords.py writes an index file for a dictionary file with '.idx'
+# appended to its name; its format is described in mkwords.py.  When a
+# dictionary has a current index file, it's searched without grep.
+index_suffix = ".idx"
+index_header = struct.Struct("<4sIIII")
+index_magic = "WIX1"
+lower_flag = 1
+trigram_flag = 2
+
 # Get the number of columns in the screen.  Use the COLUMNS
 # environment variable if it is defined; otherwise use 79.
 columns = int(os.environ["COLUMNS"]) - 1 if "COLUMNS" in os.environ else 79
@@ -136,13 +157,17 @@ Usage:  {name} [options] regexp
   Look up a regular expression in a dictionary of words.  The search
   tool is grep, so you should use grep's regular expressions.  You'll
   have to make sure the grep variable in the program points to a
-  suitable grep program.  If you search the WordNet dictionary, use an
+  suitable grep program.  If a dictionary has an index file made by
+  mkwords.py, it's searched without grep and the regexp is a python
+  regular expression.  If you search the WordNet dictionary, use an
   underscore for the space character.
 
   The WordNet options provide the ability to search the list of words
   from WordNet and see synonyms and definitions.  Note that the
   WordNet dictionary also includes combinations of words connected by
   hyphens and space (underscore) characters (use -c to exclude them).
+  The WordNet searches are done without grep, so the regexp is a
+  python regular expression for them.
 
 Options:
     -0      Use a simple English dictionary (850 words)
@@ -311,6 +336,37 @@ def ParseDataLine(line):
     synonyms = synonyms[1:] if len(synonyms) > 1 else []
     return word, letter, synonyms, definition
 
+def GetSynset(letter, offset):
+    '''Return ParseDataLine()'s tuple for the line at offset in the
+    data file for letter.  Satellite adjectives are in the adjective
+    file, so "s" is stored as "a".
+    '''
+    key = ("a" if letter == "s" else letter, offset)
+    try:
+        synset = synset_cache.pop(key)
+    except KeyError:
+        stream = streams[letter]
+        stream.seek(offset)
+        synset = ParseDataLine(stream.readline())
+        if len(synset_cache) >= synset_cache_size:
+            synset_cache.popitem(last=False)
+    synset_cache[key] = synset
+    return synset
+
+def ReadSynsets(senses):
+    '''senses is a sequence of (word, letter, head_word, offset)
+    tuples.  Put the synsets that aren't already cached into the cache;
+    they are read in order of increasing offset in each data file so
+    that the files are read from front to back.
+    '''
+    keys = set()
+    for word, letter, head_word, offset in senses:
+        key = ("a" if letter == "s" else letter, offset)
+        if key not in synset_cache:
+            keys.add(key)
+    for letter, offset in sorted(keys):
+        GetSynset(letter, offset)
+
 def PrintWord(word, letter, head_word, offset, d):
     '''word is the word as found in the index.sense file but
     displayable (the underscores are removed).  letter is one of
@@ -318,10 +374,7 @@ def PrintWord(word, letter, head_word, offset, d):
     integer to read the relevant line from the stream after performing
     a seek to that offset.  
     '''
-    stream = streams[letter]
-    stream.seek(offset)
-    line = stream.readline()
-    main_word, letter, synonyms, definition = ParseDataLine(line)
+    main_word, letter, synonyms, definition = GetSynset(letter, offset)
     key = word + "%" + letter
     indent = " "*2
     if d["-d"] or d["-" + letter]:
@@ -345,43 +398,71 @@ def PrintWord(word, letter, head_word, offset, d):
             out(indent*2, i.strip())
         normal()
 
-def PrintWordNet(word, d):
+def SenseIndex():
+    '''Return the index.sense file as an mmap object.  It's only
+    opened once.
+    '''
+    global sense_index
+    if sense_index is None:
+        with open(wordnet_files["index"], "rb") as f:
+            sense_index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return sense_index
+
+def FindSenses(word):
+    '''Return the lines of the index.sense file whose sense keys are
+    for word.  The file is sorted by sense key, so a binary search over
+    the file's byte offsets finds the first line that isn't less than
+    word + "%"; the lines for word follow it.
+    '''
+    m, prefix = SenseIndex(), word + "%"
+    # lo and hi are always at the start of a line.  The lines before
+    # lo are less than prefix and the lines at hi and after aren't.
+    lo, hi = 0, len(m)
+    while lo < hi:
+        mid = (lo + hi)//2
+        start = m.rfind("\n", 0, mid) + 1
+        end = m.find("\n", start)
+        if end == -1:
+            end = len(m)
+        if m[start:end] < prefix:
+            lo = end + 1
+        else:
+            hi = start
+    lines, n = [], len(prefix)
+    while m[lo:lo + n] == prefix:
+        end = m.find("\n", lo)
+        if end == -1:
+            end = len(m)
+        lines.append(m[lo:end])
+        lo = end + 1
+    return lines
+
+def GetSenses(word, d):
     '''word is a word in the WordNet index, so find its line(s) in the
-    index.sense file.  Then dereference each synset reference and
-    send the data to stdout.
+    index.sense file.  Return a list of the (word, letter, head_word,
+    offset) tuples to send to PrintWord() for the types of words the
+    user asked for.
     '''
     Word = word.strip().replace("_", " ")
-    # Note:  it's important to use double quotes around the regexp;
-    # otherwise the command will hang when word contains an
-    # apostrophe.
-    cmd = (grep + ' "^' + word.strip() + '%" ' +
-           wordnet_files["index"].replace("\\", "/"))
-    p = subprocess.PIPE
-    s = subprocess.Popen(cmd, bufsize=0, stdout=p, stderr=p,
-        universal_newlines=True)
-    # Get results of grep
-    lines = s.stdout.readlines()
+    # The sense keys are in lower case
+    lines = FindSenses(word.strip().lower())
     if dbg:
-        print "xx2 cmd =", cmd
         print "xx3 lines =", lines
-    error   = s.stderr.readlines()
-    if error:
-        err("PrintWordNet() grep error:")
-        for e in error:
-            err(e)
-        exit(1)
     # lines now contains those words in the WordNet index.sense file
     # that matched the word passed in.
+    senses = []
     for line in lines:
         found_word, letter, head_word, offset = ParseIndexLine(line)
         if dbg:
             print "xx4 word from index line =", found_word, letter
         if d["-d"] or d["-" + letter]:
             # Note we use Word instead of word or found_word!
-            PrintWord(Word, letter, head_word, offset, d)
+            senses.append((Word, letter, head_word, offset))
+    return senses
 
 def WordNet(regexp, d):
-    '''Given the regexp 
+    '''Given the regexp, find the matching words in the WordNet
+    dictionary file and print the information the user asked for.
     '''
     # If none of the WordNet-related options are True, just do a
     # regular lookup.
@@ -396,30 +477,201 @@ def WordNet(regexp, d):
     if no_wn:
         LookUp(regexp, d)
     # Get the word matches from the dictionary file
-    cmd = grep + " " + d["-i"] + " --color=auto " 
-    cmd += "'" + regexp + "' "
-    wd = wordnet_files["dict"].replace("\\", "/")
-    cmd += wd
-    p = subprocess.PIPE
-    s = subprocess.Popen(cmd, bufsize=0, stdout=p, stderr=p)
-    # Get results of grep
-    results = [i.strip() for i in s.stdout.readlines()]
-    error   = [i.strip() for i in s.stderr.readlines()]
-    if error:
-        err("WordNet() grep error:")
-        for e in error:
-            err(e)
-        exit(1)
+    r = Compile(regexp, d)
+    index = OpenIndex(wordnet_files["dict"])
+    if index is not None:
+        results = SearchIndex(index, r)
+    else:
+        try:
+            with open(wordnet_files["dict"]) as f:
+                words = [i.strip() for i in f]
+        except IOError as e:
+            Error("Can't read '%s':  %s" % (wordnet_files["dict"], e))
+        results = [i for i in words if r.search(i)]
     # We have the full words that matched in results, so print out
     # what the user has requested.
     results.sort()
     if dbg:
         print "xx1 results =", results
+    senses = []
     for word in results:
-        PrintWordNet(word, d)
+        senses.extend(GetSenses(word, d))
+    # Read the synsets for a batch of senses in file order, then print
+    # them.  A batch is smaller than the cache so none of its synsets
+    # are dropped before they're printed.
+    n = synset_cache_size//2
+    for i in range(0, len(senses), n):
+        batch = senses[i:i + n]
+        ReadSynsets(batch)
+        for word, letter, head_word, offset in batch:
+            PrintWord(word, letter, head_word, offset, d)
     exit(0)
 
+def Compile(regexp, d):
+    try:
+        return re.compile(regexp, re.I if d["-i"] else 0)
+    except re.error as e:
+        Error("'%s' is not a valid regular expression:  %s" % (regexp, e))
+
+def OpenIndex(dict_file):
+    '''Return a dictionary describing the index file for dict_file or
+    None if there isn't one that is at least as new as dict_file.  The
+    file is memory-mapped, so only the parts a search needs are read.
+    '''
+    index_file = dict_file + index_suffix
+    try:
+        if os.stat(index_file).st_mtime < os.stat(dict_file).st_mtime:
+            return None
+        with open(index_file, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    if len(m) < index_header.size:
+        return None
+    magic, flags, n, t, size = index_header.unpack_from(m)
+    if magic != index_magic:
+        return None
+    index = {"map": m, "flags": flags, "n": n, "t": t}
+    index["offsets"] = index_header.size
+    index["words"] = index["offsets"] + 4*(n + 1)
+    index["size"] = size
+    index["keys"] = index["words"] + size
+    index["starts"] = index["keys"] + 3*t
+    index["postings"] = index["starts"] + 4*(t + 1)
+    return index
+
+def GetWord(index, i):
+    '''Return word number i from the index.
+    '''
+    start, end = struct.unpack_from("<II", index["map"],
+                                    index["offsets"] + 4*i)
+    w = index["words"]
+    return index["map"][w + start:w + end - 1]
+
+def Bisect(n, test):
+    '''Return the smallest i in [0, n) for which test(i) is True or n
+    if there isn't one; test must be False and then True as i increases.
+    '''
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi)//2
+        if test(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def Literals(r):
+    '''Return (prefix, strings) for the compiled regular expression r.
+    prefix is the string that a matched word must start with (empty if
+    the regexp isn't anchored with '^') and strings is a list of the
+    strings that a matched word must contain.  Return None if the
+    regexp uses \\A or \\Z, which only work on one word at a time.
+    '''
+    items = list(sre_parse.parse(r.pattern, r.flags))
+    strings, run, anchored = [], [], False
+    for i, (op, av) in enumerate(items):
+        if op == sre.LITERAL and av < 256:
+            run.append(chr(av))
+            continue
+        if op == sre.AT and av in (sre.AT_BEGINNING_STRING,
+                                   sre.AT_END_STRING):
+            return None
+        if run:
+            strings.append("".join(run))
+            run = []
+        if i == 0 and op == sre.AT and av == sre.AT_BEGINNING:
+            anchored = True
+    if run:
+        strings.append("".join(run))
+    prefix = ""
+    if anchored and strings and items[1][0] == sre.LITERAL:
+        prefix = strings[0]
+    return prefix, strings
+
+def Postings(index, key):
+    '''Return the tuple of the numbers of the words containing the
+    trigram key.
+    '''
+    m, keys = index["map"], index["keys"]
+    i = Bisect(index["t"], lambda j: m[keys + 3*j:keys + 3*j + 3] >= key)
+    if i == index["t"] or m[keys + 3*i:keys + 3*i + 3] != key:
+        return ()
+    start, end = struct.unpack_from("<II", m, index["starts"] + 4*i)
+    return struct.unpack_from("<%dI" % (end - start), m,
+                              index["postings"] + 4*start)
+
+def ScanWords(index, r):
+    '''Return the list of words in the index matched by r by searching
+    the whole words section at once.
+    '''
+    w = index["words"]
+    buffer = index["map"][w:w + index["size"]]
+    regexp = re.compile(r.pattern, r.flags | re.M)
+    results, last = [], -1
+    for mo in regexp.finditer(buffer):
+        start = buffer.rfind("\n", 0, mo.start()) + 1
+        if start <= last:
+            continue        # Already have this word
+        # The match can span words, so check each word it touches
+        end = buffer.find("\n", max(mo.end() - 1, mo.start()))
+        if end == -1:
+            end = len(buffer)
+        for word in buffer[start:end].split("\n"):
+            if word and r.search(word):
+                results.append(word)
+        last = buffer.rfind("\n", 0, end) + 1
+    return results
+
+def SearchIndex(index, r):
+    '''Return the sorted list of words in the index that are matched by
+    the compiled regular expression r.  If a matched word must start
+    with a string, the words are found by a binary search; if it must
+    contain a string of at least three characters and the index has
+    trigrams, the candidate words are gotten from the trigram postings.
+    Otherwise all the words are searched.
+    '''
+    literals = Literals(r)
+    if literals is None:
+        w = index["words"]
+        return [i for i in index["map"][w:w + index["size"]].split("\n")
+                if i and r.search(i)]
+    prefix, strings = literals
+    ignore_case = r.flags & re.I
+    if prefix and ignore_case and not index["flags"] & lower_flag:
+        prefix = ""     # Can't use the sort order
+    if prefix:
+        if ignore_case:
+            prefix = prefix.lower()
+        n, k = index["n"], len(prefix)
+        lo = Bisect(n, lambda i: GetWord(index, i) >= prefix)
+        hi = Bisect(n, lambda i: GetWord(index, i)[:k] > prefix)
+        candidates = range(lo, hi)
+    elif index["flags"] & trigram_flag and max(map(len, strings + [""])) > 2:
+        postings = []
+        for s in strings:
+            s = s.lower()
+            postings.extend(Postings(index, s[i:i + 3])
+                            for i in range(len(s) - 2))
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(p)
+        candidates = sorted(candidates)
+    else:
+        return ScanWords(index, r)
+    words = (GetWord(index, i) for i in candidates)
+    return [i for i in words if r.search(i)]
+
 def LookUp(regexp, d):
+    index = OpenIndex(d["dict"][d["which_dict"]])
+    if index is not None:
+        results = SearchIndex(index, Compile(regexp, d))
+        for word in results:
+            out(word)
+        exit(0 if results else 1)
     cmd = grep + " " + d["-i"] + " --color=auto " 
     cmd += "'" + regexp + "' "
     wd = d["dict"][d["which_dict"]].replace("\\", "/")
@@ -1,6 +1,24 @@
 '''
 Make a words file from the index.sense file included in the WordNet
-3.0 release.
+3.0 release.  An index of the words that lookup.py can search without
+running grep is also written; its name is the words file's name with
+'.idx' appended.  The index file is (all integers are unsigned 32 bit
+little-endian numbers):
+
+    Header:  the 4 bytes 'WIX1', flags, number of words n, number of
+        trigrams t, size of the words section
+    Offsets:  n + 1 integers giving the start of each word in the words
+        section (the last is the section's size)
+    Words:  the words in sorted order, each followed by a newline
+    Trigram keys (if flags has trigram_flag set):  t 3-byte trigrams
+        in sorted order
+    Trigram offsets:  t + 1 integers giving the start of each trigram's
+        postings (as an index into the postings)
+    Postings:  the numbers of the words that contain each trigram in
+        increasing order
+
+The trigrams are those of the lower case form of the words.  flags has
+lower_flag set if all the words are in lower case.
 
 ---------------------------------------------------------------------------
 Copyright (C) 2012 Don Peterson
@@ -16,7 +34,12 @@ ANY KIND. See http://www.dspguru.com/wide-open-license for more
 information.
 '''
 
-import sys, os, getopt
+import sys, os, getopt, struct
+from collections import defaultdict
+
+index_magic = "WIX1"
+lower_flag = 1
+trigram_flag = 2
 
 def out(*v, **kw):
     sep = kw.setdefault("sep", " ")
@@ -30,18 +53,29 @@ def out(*v, **kw):
 def Usage(d, status=1):
     name = sys.argv[0]
     s = '''
-Usage:  {name} input_file output_words_file
+Usage:  {name} [options] input_file output_words_file
   Make an ASCII text file that is the list of words in the index.sense
-  file of the WordNet 3.0 distribution.
+  file of the WordNet 3.0 distribution.  The index file for lookup.py
+  is written to output_words_file.idx.
+
+Options:
+    -t      Include the trigrams in the index file.  This makes it a
+            number of times bigger, but lookup.py can then find the
+            words that contain a string without looking at every word.
+    -x      The only argument is a words file (one word per line) and
+            only its index file is written.  Use this to let lookup.py
+            search your other dictionaries without grep.
 '''[1:-1]
     out(s.format(**locals()))
     sys.exit(status)
 
 def ParseCommandLine(d):
-    if len(sys.argv) < 3:
+    d["-t"] = False     # Include trigrams in the index
+    d["-x"] = False     # Only make an index for a words file
+    if len(sys.argv) < 2:
         Usage(d)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "h")
+        optlist, args = getopt.getopt(sys.argv[1:], "htx")
     except getopt.GetoptError as str:
         msg, option = str
         out(msg)
@@ -49,7 +83,11 @@ def ParseCommandLine(d):
     for opt in optlist:
         if opt[0] == "-h":
             Usage(d, status=0)
-    if len(args) != 2:
+        if opt[0] == "-t":
+            d["-t"] = True
+        if opt[0] == "-x":
+            d["-x"] = True
+    if len(args) != (1 if d["-x"] else 2):
         Usage(d)
     return args
 
@@ -70,10 +108,53 @@ def WriteOutput(words, outfile):
     for word in w:
         ofp.write(word + "\n")
 
+def Pack(numbers):
+    return struct.pack("<%dI" % len(numbers), *numbers)
+
+def WriteIndex(words, outfile, trigrams=False):
+    '''Write the index file for the sequence of words (see the module
+    docstring for its format).
+    '''
+    w = sorted(words)
+    offsets, pos = [], 0
+    for word in w:
+        offsets.append(pos)
+        pos += len(word) + 1
+    offsets.append(pos)
+    flags = lower_flag if all(i == i.lower() for i in w) else 0
+    keys, starts, postings = [], [0], []
+    if trigrams:
+        flags |= trigram_flag
+        t = defaultdict(list)
+        for n, word in enumerate(w):
+            word = word.lower()
+            for i in set(word[j:j + 3] for j in range(len(word) - 2)):
+                t[i].append(n)
+        for key in sorted(t):
+            keys.append(key)
+            postings.extend(t[key])
+            starts.append(len(postings))
+    ofp = open(outfile, "wb")
+    ofp.write(struct.pack("<4sIIII", index_magic, flags, len(w), len(keys),
+                          pos))
+    ofp.write(Pack(offsets))
+    ofp.write("".join(i + "\n" for i in w))
+    if trigrams:
+        ofp.write("".join(keys))
+        ofp.write(Pack(starts))
+        ofp.write(Pack(postings))
+    ofp.close()
+
 def main():
     d = {} # Options dictionary
-    infile, outfile = ParseCommandLine(d)
+    args = ParseCommandLine(d)
+    if d["-x"]:
+        words = [i.rstrip("\r\n") for i in open(args[0])]
+        WriteIndex([i for i in words if i], args[0] + ".idx", d["-t"])
+        return
+    infile, outfile = args
     words = GetWords(infile)
     WriteOutput(words, outfile)
+    WriteIndex(words, outfile + ".idx", d["-t"])
 
 main()
@@ -4,6 +4,8 @@ that are not part of Ogden's 850 basic English words.
 '''
 
 import sys, os, getopt, string
+import multiprocessing
+from collections import Counter
 from pdb import set_trace as xx
 if 0:
     import debug
@@ -91,6 +93,18 @@ ogdens_words = set('''
     yes yesterday you young
     '''.split())
 
+# Make a translator that changes everything that's not a digit or
+# lowercase letter into a space.
+all = string.maketrans("", "")     # All 8 bit bytes
+assert(len(all) == 256)
+# Remove digits and lowercase letters
+other = all.translate(all, string.digits + string.ascii_lowercase)
+translator = string.maketrans(other, " "*len(other))
+del all, other
+
+# Files are read in pieces of this many bytes
+chunk_size = 1 << 20
+
 def out(*v, **kw):
     sep = kw.setdefault("sep", " ")
     nl  = kw.setdefault("nl", True)
@@ -111,62 +125,112 @@ def Error(msg, status=1):
 def Usage(d, status=1):
     name = sys.argv[0]
     s = '''
-Usage:  {name} [file1 [file2 ...]]
+Usage:  {name} [options] [file1 [file2 ...]]
   Split the (text) files into words by substituting space characters
   for all punctuation and splitting on whitespace.  After converting
   to lowercase, print out any words that are not in Ogden's "Basic 
   English" list of 850 words.
 
 Options:
+    -c
+        Print the number of times each word was found.
     -h 
         Print a manpage.
+    -j num
+        Use num processes to read the files.
 '''[1:-1]
     out(s.format(**locals()))
     sys.exit(status)
 
 def ParseCommandLine(d):
+    d["-c"] = False     # Count the words
+    d["-j"] = 1         # Number of processes
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "h")
+        optlist, args = getopt.getopt(sys.argv[1:], "chj:")
     except getopt.GetoptError as str:
         msg, option = str
         out(msg)
         sys.exit(1)
     for opt in optlist:
+        if opt[0] == "-c":
+            d["-c"] = True
         if opt[0] == "-h":
             Usage(d, status=0)
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                Error("'%s' is not a valid number of processes" % opt[1])
     return args
 
-def GetLines(files):
-    s = []
-    for file in files:
-        s += open(file).readlines()
-    return s
+def GetWords(stream, count=False):
+    '''Return a set of the lowercase words in the stream or a Counter
+    of them if count is True.  The stream is read a chunk at a time; a
+    word that may continue into the next chunk is held back until it's
+    read.
+    '''
+    words = Counter() if count else set()
+    partial = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        s = (partial + chunk.lower()).translate(translator)
+        partial = ""
+        if s[-1] != " ":
+            s, space, partial = s.rpartition(" ")
+        words.update(s.split())
+    if partial:
+        words.update([partial])
+    return words
+
+def FileWords(args):
+    '''Return GetWords()'s result for the file in args, which is a
+    (file, count) tuple.  This is the worker for the process pool.
+    '''
+    file, count = args
+    with open(file, "rb") as f:
+        return GetWords(f, count)
 
-def GetWords(lines):
-    '''Convert all the text to a single string, make it lowercase,
-    then return it as a set of words.
+def GetAllWords(files, d):
+    '''Return a set (or a Counter for -c) of the words in the files.
+    More than one file is read at a time if -j was used.
     '''
-    s = ' '.join(lines).lower()
-    # Make a translator that changes everything that's not a digit or
-    # lowercase letter into a space.
-    all = string.maketrans("", "")     # All 8 bit bytes
-    assert(len(all) == 256)
-    # Remove digits and lowercase letters
-    other = all.translate(all, string.digits + string.ascii_lowercase)
-    t = string.maketrans(other, " "*len(other))
-    # Split into words and turn into a set
-    return set(s.translate(t).split())
+    words = Counter() if d["-c"] else set()
+    jobs = [(i, d["-c"]) for i in files]
+    if d["-j"] > 1 and len(files) > 1:
+        pool = multiprocessing.Pool(min(d["-j"], len(files)))
+        try:
+            for w in pool.imap_unordered(FileWords, jobs):
+                words.update(w)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            words.update(FileWords(job))
+    return words
 
 def main():
     d = {} # Options dictionary
     files = ParseCommandLine(d)
-    lines = sys.stdin.readlines() if not files else GetLines(files)
-    words = GetWords(lines)
-    big_words = list(words - ogdens_words)
-    big_words.sort()
+    if files:
+        try:
+            words = GetAllWords(files, d)
+        except IOError as e:
+            Error(str(e))
+    else:
+        words = GetWords(sys.stdin, d["-c"])
+    big_words = sorted(set(words) - ogdens_words)
     if big_words:
         out("The following words are not in Ogden's simple English words:")
     for word in big_words:
-        out(" ", word)
+        if d["-c"]:
+            out("  %6d %s" % (words[word], word))
+        else:
+            out(" ", word)
 
-main()
+if __name__ == "__main__":
+    main()
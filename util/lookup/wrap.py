@@ -161,29 +161,34 @@ def Wrap(line, d):
     indent = 0
     while line[indent] == " ":
         indent += 1
-    s = " "*indent
-    words = line.split()
-    for word in words:
+    # parts holds the pieces of the current output line and n is its
+    # length, so the pieces only get joined once per output line.
+    parts, n = [" "*indent], indent
+    for word in line.split():
         t = _InsertSpace(word, d)
-        if len(s + t) <= width:
-            s += t
+        if n + len(t) <= width:
+            parts.append(t)
+            n += len(t)
         else:
-            results.append(s)
-            s = " "*indent + t
-    s = s.rstrip()  # Ensure no extraneous whitespace at end
-    results.append(s)
+            results.append("".join(parts))
+            parts, n = [" "*indent, t], indent + len(t)
+    # Ensure no extraneous whitespace at end
+    results.append("".join(parts).rstrip())
     return results
 
-def _Process(lines, d):
-    s = []
+def _Process(lines, d, stream):
+    '''Wrap each line from the iterable lines and write it to stream as
+    soon as it's wrapped.  The wrapped lines are separated by an empty
+    line.
+    '''
+    first = True
     for line in lines:
         t = Wrap(line, d)
         if t:
-            s += t + [""]
-    if not s[-1]:
-        # Don't end with an empty line
-        del s[-1]
-    return '\n'.join(s)
+            if not first:
+                stream.write("\n")
+            stream.write("\n".join(t) + "\n")
+            first = False
 
 def _main():
     d = {} # Options dictionary
@@ -197,9 +202,9 @@ def _main():
             outfile = args[1]
         else:
             _Error("Too many command line arguments (use -h for manpage")
-    lines = open(file).readlines() if file is not None else sys.stdin.readlines()
+    lines = open(file) if file is not None else sys.stdin
     stream = open(outfile, "w") if outfile is not None else sys.stdout
-    _out(_Process(lines, d), stream=stream)
+    _Process(lines, d, stream)
 
 if __name__ == "__main__":
     _main()
@@ -16,7 +16,17 @@ information.
 '''
 
 from __future__ import division
-import sys, os, os.path, getopt, functools, time, re
+import sys, os, os.path, getopt, functools, time, re, stat, heapq
+import itertools
+from multiprocessing.dummy import Pool as ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # Backport for python 2
+    except ImportError:
+        scandir = None
 
 
 nl = "\n"
@@ -70,6 +80,7 @@ err  = functools.partial(StreamOut, [sys.stderr])
 
 manual = '''\
 Usage:  {name} [options] [time [dir [dir2...]]]
+        {name} [options] -N num [dir [dir2...]]
   Prints out files that have changed within the specified time.  The time
   specifier is days; if a letter is appended, then that gives the units.
   The units are:
@@ -85,10 +96,21 @@ Usage:  {name} [options] [time [dir [dir2...]]]
 
   Mercurial directories are ignored unless the -m option is given.
 
+  With the -N or -O option, the time isn't given and the num most
+  recently (or least recently) changed files are printed with their
+  modification times, newest first.
+
 Options
     -c
         Ignore commonly-named files (change the script's common_files
         global variable to set the files to ignore).
+    -j num
+        Use num threads to stat the files.  This helps on slow (e.g.,
+        network) filesystems.
+    -N num
+        Print the num most recently changed files.
+    -O num
+        Print the num least recently changed files.
     -r
         Do not behave recursively.
     -m  
@@ -100,7 +122,8 @@ Options
         Ignore picture-type files.
     -x regexp
         Ignore files that match a regexp.  You can have more than one of
-        these options.
+        these options.  A directory whose path (with a trailing '/')
+        matches is skipped along with everything below it.
 '''[:-1]
 
 def Usage(status=1):
@@ -110,13 +133,16 @@ def Usage(status=1):
 
 def ParseCommandLine(d):
     d["-c"] = False
+    d["-j"] = 1
     d["-m"] = False
     d["-n"] = False
+    d["-N"] = 0
+    d["-O"] = 0
     d["-p"] = False
     d["-r"] = False
     d["-x"] = []
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "chmnprx:")
+        optlist, args = getopt.getopt(sys.argv[1:], "chj:mnN:O:prx:")
     except getopt.GetoptError as str:
         msg, option = str
         out(msg + nl)
@@ -126,6 +152,15 @@ def ParseCommandLine(d):
             d["-c"] = True
         if opt[0] == "-h":
             Usage(0)
+        if opt[0] in ("-j", "-N", "-O"):
+            try:
+                d[opt[0]] = int(opt[1])
+                if d[opt[0]] < 1:
+                    raise ValueError()
+            except ValueError:
+                err("'%s' must be a positive integer for %s" % (opt[1],
+                    opt[0]))
+                exit(1)
         if opt[0] == "-m":
             d["-m"] = True
         if opt[0] == "-n":
@@ -136,11 +171,16 @@ def ParseCommandLine(d):
             d["-r"] = True
         if opt[0] == "-x":
             d["-x"].append(opt[1])
-    if len(args) == 0:
+    if d["-N"] or d["-O"]:
+        # No time is given
+        args = [None] + (args or ["."])
+    elif len(args) == 0:
         args = ["1d", "."]
     elif len(args) == 1:
         args.append(".")
-    # If we have any regexp's, compile them.
+    # If we have any regexp's, compile them.  They are searched one at
+    # a time, as joining them into one alternation would renumber their
+    # groups and break backreferences.
     regexps = d["-x"]
     for i in xrange(len(regexps)):
         try:
@@ -171,15 +211,54 @@ def GetTime(timespec):
     t = float(timespec[:-1])*suffixes[last_char]
     return t
 
-def ProcessDirectory(dir, d):
-    for root, dirs, files in os.walk(dir):
-        root = root.replace("\\", "/")
-        components = root.split("/")
-        if ".hg" in components and not d["-m"]:
-            continue
-        ProcessFiles(root, files, d)
+def ListDirectory(dir):
+    '''Return (dirs, files), the names of the subdirectories and of the
+    other entries in dir.  Symbolic links to directories are not
+    followed.
+    '''
+    dirs, files = [], []
+    try:
+        if scandir is not None:
+            for entry in scandir(dir):
+                try:
+                    isdir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    isdir = False
+                (dirs if isdir else files).append(entry.name)
+        else:
+            for name in os.listdir(dir):
+                try:
+                    isdir = stat.S_ISDIR(os.lstat(os.path.join(dir,
+                                                               name)).st_mode)
+                except OSError:
+                    isdir = False
+                (dirs if isdir else files).append(name)
+    except OSError:
+        pass
+    return dirs, files
+
+def GetFiles(dir, d):
+    '''Generator that yields the files at and below dir that aren't
+    ignored.
+    '''
+    stack = [dir.replace("\\", "/")]
+    while stack:
+        root = stack.pop()
+        dirs, files = ListDirectory(root)
+        for file in files:
+            file = os.path.join(root, file).replace("\\", "/")
+            if file[:2] == "./":
+                file = file[2:]
+            if not IgnoreFile(file, d):
+                yield file
         if d["-r"]:
             break
+        subdirs = []
+        for name in dirs:
+            if name == ".hg" and not d["-m"]:
+                continue
+            subdirs.append(os.path.join(root, name).replace("\\", "/"))
+        stack.extend(reversed(subdirs))
 
 def IgnoreFile(file, d):
     '''If the indicated file is a picture file (indicated by its extension)
@@ -193,40 +272,82 @@ def IgnoreFile(file, d):
         name = os.path.split(file)[1].lower()
         if name in common_files:
             return True
-    if d["-x"]:
-        for r in d["-x"]:
-            if r.search(file):
-                return True
+    for r in d["-x"]:
+        if r.search(file):
+            return True
     if d["-p"]:
         ext = os.path.splitext(os.path.split(file)[1])[1].lower()
         if ext in picture_extensions:
             return True
     return False
 
-def ProcessFiles(root, files, d):
-    for file in files:
-        file = os.path.join(root, file).replace("\\", "/")
-        if file[:2] == "./":
-            file = file[2:]
-        if IgnoreFile(file, d):
-            continue
-        try:
-            last_change_time = os.stat(file).st_mtime
-            if d["-n"]:
+def GetModificationTime(file):
+    '''Return (mtime, file) or None if the file can't be stat'ed.
+    '''
+    try:
+        return (os.stat(file).st_mtime, file)
+    except Exception:
+        return None
+
+def ProcessDirectory(dir, d):
+    '''Print the files in the time window or, with -N or -O, keep the
+    newest or oldest files in a heap bounded to the requested size.
+    The stat calls are made by a pool of threads if -j was given; the
+    files are still handled in the order they were found.
+    '''
+    pool = ThreadPool(d["-j"]) if d["-j"] > 1 else None
+    if pool:
+        stats = pool.imap(GetModificationTime, GetFiles(dir, d), 64)
+    else:
+        stats = itertools.imap(GetModificationTime, GetFiles(dir, d))
+    try:
+        for item in stats:
+            if item is None:
+                continue
+            last_change_time, file = item
+            if d["-N"]:
+                Keep(d["heap"], d["-N"], item)
+            elif d["-O"]:
+                Keep(d["heap"], d["-O"], (-last_change_time, file))
+            elif d["-n"]:
                 if abs(d["now"] - last_change_time) > d["time sec"]:
                     out(file)
             else:
                 if abs(d["now"] - last_change_time) <= d["time sec"]:
                     out(file)
-        except Exception:
-            pass
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+def Keep(heap, n, item):
+    '''Keep the n largest items in heap.
+    '''
+    if len(heap) < n:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+def PrintHeap(d):
+    '''Print the files kept for -N or -O, newest first.
+    '''
+    items = sorted(d["heap"], reverse=True)
+    if d["-O"]:
+        items = [(-t, file) for t, file in reversed(items)]
+    for t, file in items:
+        tm = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+        out(tm, "  ", file)
 
 def main():
     d = {} # Options dictionary
     args = ParseCommandLine(d)
-    d["time sec"] = GetTime(args[0])  # Return time interval in seconds
+    if args[0] is not None:
+        d["time sec"] = GetTime(args[0])  # Return time interval in seconds
     d["now"] = time.time()
+    d["heap"] = []
     for dir in args[1:]:
         ProcessDirectory(dir, d)
+    if d["-N"] or d["-O"]:
+        PrintHeap(d)
 
 main()
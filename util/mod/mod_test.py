@@ -0,0 +1,40 @@
+from __future__ import print_function
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from lwtest import run, assert_equal
+
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mod.py")
+
+def Mod(dir, *args):
+    '''Run mod.py in dir and return the set of files it prints.
+    '''
+    p = subprocess.Popen([sys.executable, script] + list(args),
+                         stdout=subprocess.PIPE, cwd=dir)
+    return set(p.communicate()[0].split())
+
+def testIgnore():
+    dir = tempfile.mkdtemp()
+    try:
+        for file in ("c/c/k.txt", "a/b/f.txt", "zq.txt"):
+            path = os.path.join(dir, file)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+        everything = set(["c/c/k.txt", "a/b/f.txt", "zq.txt"])
+        assert_equal(Mod(dir, "1d", "."), everything)
+        # Each pattern keeps its own groups for backreferences
+        assert_equal(Mod(dir, "-x", "z(q)", "-x", r"(c)/\1", "1d", "."),
+                     set(["a/b/f.txt"]))
+        # A pattern that only matches a directory with a trailing '/'
+        # doesn't ignore the files in it
+        assert_equal(Mod(dir, "-x", "b/$", "1d", "."), everything)
+        assert_equal(Mod(dir, "-x", "^a/", "1d", "."),
+                     set(["c/c/k.txt", "zq.txt"]))
+    finally:
+        shutil.rmtree(dir)
+
+if __name__ == "__main__":
+    run(globals())
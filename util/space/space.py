@@ -25,7 +25,8 @@ ANY KIND. See http://www.dspguru.com/wide-open-license for more
 information.
 '''
 
-import string, os, getopt, sys
+import string, os, getopt, sys, heapq, multiprocessing, stat
+import cPickle as pickle
 from pdb import set_trace as xx
 
 
@@ -36,15 +37,40 @@ nl = "\n"
 # Contains directory name and total size
 DirSizes = []
 
+# Directory name --> total bytes of the files at and below it
+SubtreeSizes = {}
+
+# Directory name --> list of its immediate subdirectories
+Children = {}
+
+# Directory name --> total bytes of the files directly in it
+OwnSizes = {}
+
+# Files with more than one hard link, keyed by (st_dev, st_ino) so
+# that each is only counted once.  Values are (size, directory, file).
+Linked = {}
+
+# If true, use the space allocated on disk (st_blocks) rather than
+# the apparent file size.  This is what du reports and it differs
+# for sparse files.
+Allocated = False
+
 # Data for finding biggest files
 NumBigFiles = 10   # How many to track
-BigFiles    = []   # List of (size, filename)
+BigFiles    = []   # List of (size, filename); a heap while walking
 Threshold   = 0    # MB threshold; if nonzero, show all file sizes
                    # that are >= to this value.
 
 # If true, list the sizes of each directory under given directory
 directories_only = 0
 
+# The size index used by the -i option.  It holds the size of each
+# directory's own files along with the directory's mtime; a directory
+# is only rescanned when its mtime changes.
+IndexFile = os.path.join(os.path.expanduser("~"), ".space_index")
+IndexVersion = 2
+IndexedBigFiles = 100   # Biggest files remembered for each directory
+
 manual = '''
 Usage:  {name} [options] directory 
 
@@ -52,9 +78,23 @@ Usage:  {name} [options] directory
   directory.
 
 Options
+    -a
+        Report the space allocated on disk (from st_blocks, as du does)
+        rather than the apparent file sizes.  Sparse files then only
+        count for the blocks they use.
     -d
         Change behavior to print the size of the files underneath each
         directory in the given directory.
+    -i
+        Use the size index in {indexfile} and only rescan the
+        directories whose modification time has changed since the last
+        run; the totals are then recomputed from the index.  Note a
+        directory's mtime only changes when files are added, removed
+        or renamed, so files that have grown in place won't be seen
+        until their directory changes.
+    -j num
+        Scan the subdirectories of the given directory with num
+        processes in parallel.
     -n num
         How big to make the list of biggest files.  Default = {numbigfiles}.
     -p pct
@@ -65,84 +105,361 @@ Options
 Hints:
   I use this program to help me see the largest files and directory at and
   below a certain point.  Because it has to walk the whole directory tree,
-  it can take significant time to execute.
+  it can take significant time to execute.  Use -j on large volumes.
+  Files with more than one hard link (e.g., rsync snapshot backups) are
+  only counted once.
 '''[1:-1]
 
 def Usage(d, status=1):
     '''d is the options dictionary.
     '''
     numbigfiles = NumBigFiles
+    indexfile = IndexFile
     name = sys.argv[0]
     threshold = d["-p"]
     print manual.format(**locals())
     exit(status)
 
-def TrimBigFiles():
-    '''Trim the container.  If Threshold is nonzero, we keep all
-    files larger than the threshold.  Otherwise, just keep the
-    specified number.
+def KeepBigFile(size, file):
+    '''Add the (size, file) pair to the BigFiles heap.  If Threshold is
+    nonzero, we keep all files larger than the threshold.  Otherwise,
+    the heap is bounded to the specified number of files, so the
+    smallest is discarded when a bigger one comes along.
     '''
-    global BigFiles
-    BigFiles.sort()
     if Threshold:
-        BigFiles = [x for x in BigFiles if x[0] > Threshold*1e6]
-    else:
-        BigFiles = BigFiles[-NumBigFiles:]
+        if size > Threshold*1e6:
+            heapq.heappush(BigFiles, (size, file))
+    elif len(BigFiles) < NumBigFiles:
+        heapq.heappush(BigFiles, (size, file))
+    elif BigFiles and (size, file) > BigFiles[0]:
+        heapq.heapreplace(BigFiles, (size, file))
 
-def GetTotalFileSize(dummy_param, directory, list_of_files):
-    '''Given a list of files and the directory they're in, add the
-    total size and directory name to the global list DirSizes.
+def FileSize(st):
+    '''Return the size in bytes of the file whose stat result is st.
+    '''
+    if Allocated and hasattr(st, "st_blocks"):
+        return st.st_blocks*512
+    return st.st_size
+
+def GetTotalFileSize(directory, list_of_files):
+    '''Given a list of files and the directory they're in, return the
+    total size of the files and record each one in BigFiles.  Files
+    with more than one hard link are recorded in Linked instead and
+    are skipped if they've already been seen.
     '''
-    global DirSizes, BigFiles
-    currdir = os.getcwd()
-    os.chdir(directory)
     total_size = 0
-    if len(list_of_files) != 0:
-        for file in list_of_files:
-            if file == ".." or file == ".":  continue
-            # The following is needed because (apparently) cygwin changed
-            # from using nul to /dev/null, yet if there is a file called
-            # 'nul', it causes a problem in the os.stat command.
-            if file == "nul":  
+    for file in list_of_files:
+        # The following is needed because (apparently) cygwin changed
+        # from using nul to /dev/null, yet if there is a file called
+        # 'nul', it causes a problem in the os.stat command.
+        if file == "nul":  
+            continue
+        path = os.path.join(directory, file)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        size = FileSize(st)
+        if st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            if key in Linked:
                 continue
-            try:
-                size = os.stat(file)[6]
-            except OSError:
+            Linked[key] = (size, directory, path)
+        else:
+            KeepBigFile(size, path)
+        total_size = total_size + size
+    return total_size
+
+def WalkTree(directory):
+    '''Fill in OwnSizes, SubtreeSizes and Children for the tree at
+    directory.  os.walk with topdown=False visits the children before
+    their parent, so the subtree totals are aggregated bottom-up.
+    '''
+    for root, dirs, files in os.walk(directory, topdown=False):
+        total_size = GetTotalFileSize(root, files)
+        OwnSizes[root] = total_size
+        subdirs = [os.path.join(root, i) for i in dirs]
+        Children[root] = subdirs
+        SubtreeSizes[root] = total_size + sum(SubtreeSizes.get(i, 0)
+                                              for i in subdirs)
+
+def Reset():
+    global BigFiles
+    BigFiles = []
+    for i in (OwnSizes, SubtreeSizes, Children, Linked):
+        i.clear()
+
+def SetOptions(options):
+    '''Pool initializer:  the options are passed in explicitly
+    because the worker processes may not inherit our globals.
+    '''
+    global Threshold, NumBigFiles, Allocated
+    Threshold, NumBigFiles, Allocated = options
+
+def GetPool(numprocs):
+    options = (Threshold, NumBigFiles, Allocated)
+    return multiprocessing.Pool(numprocs, SetOptions, (options,))
+
+def ScanSubtree(directory):
+    '''Worker for the -j option:  walk one subtree in a separate
+    process and return its results.
+    '''
+    Reset()
+    WalkTree(directory)
+    return OwnSizes, SubtreeSizes, Children, BigFiles, Linked
+
+def ParallelWalkTree(directory, numprocs):
+    '''Same as WalkTree, but each subdirectory of directory is walked
+    by a pool of numprocs processes.  The results are merged here;
+    a hard-linked file seen in more than one subtree is removed from
+    the totals of the directories it was counted in after the first.
+    '''
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    dirs, files = [], []
+    for name in names:
+        path = os.path.join(directory, name)
+        (dirs if os.path.isdir(path) else files).append(name)
+    subdirs = [os.path.join(directory, i) for i in dirs]
+    total_size = GetTotalFileSize(directory, files)
+    pool = GetPool(numprocs)
+    try:
+        results = pool.map(ScanSubtree, [i for i in subdirs
+                                         if not os.path.islink(i)])
+    finally:
+        pool.close()
+        pool.join()
+    for own, subtree, children, big, linked in results:
+        OwnSizes.update(own)
+        SubtreeSizes.update(subtree)
+        Children.update(children)
+        for item in big:
+            KeepBigFile(*item)
+        for key, (size, root, path) in linked.items():
+            if key not in Linked:
+                Linked[key] = (size, root, path)
                 continue
-            total_size = total_size + size
-            BigFiles.append((size, os.path.join(directory, file)))
-    DirSizes.append([total_size, directory])
-    TrimBigFiles()
-    os.chdir(currdir)
+            OwnSizes[root] -= size
+            while root in SubtreeSizes:
+                SubtreeSizes[root] -= size
+                root = os.path.dirname(root)
+    OwnSizes[directory] = total_size
+    Children[directory] = subdirs
+    SubtreeSizes[directory] = total_size + sum(SubtreeSizes.get(i, 0)
+                                               for i in subdirs)
+
+def ScanDirectory(directory):
+    '''Read the directory and return its index entry, a tuple of
+        mtime       Modification time of the directory
+        size        Total bytes of the files that have one link
+        subdirs     Names of the subdirectories
+        bigfiles    Biggest (size, name) of the files with one link,
+                    sorted in decreasing size.  If Threshold is set,
+                    all the files at or above it are included.
+        rest        Size of the biggest file not in bigfiles or -1 if
+                    bigfiles holds all of the files
+        linked      (st_dev, st_ino, size, name) of the files with
+                    more than one link
+    None is returned if the directory can't be read.
+    '''
+    try:
+        mtime = os.stat(directory).st_mtime
+        names = os.listdir(directory)
+    except OSError:
+        return None
+    size, subdirs, files, linked = 0, [], [], []
+    for name in names:
+        if name == "nul":
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            subdirs.append(name)
+        elif st.st_nlink > 1:
+            linked.append((st.st_dev, st.st_ino, FileSize(st), name))
+        else:
+            files.append((FileSize(st), name))
+            size += files[-1][0]
+    n = max(IndexedBigFiles, NumBigFiles)
+    if Threshold:
+        n = max(n, sum(1 for i in files if i[0] >= Threshold*1e6))
+    # Get one more than is kept to know the size of the rest
+    bigfiles = heapq.nlargest(n + 1, files)
+    rest = bigfiles.pop()[0] if len(bigfiles) > n else -1
+    return (mtime, size, subdirs, bigfiles, rest, linked)
+
+def NeedsRescan(entry, mtime):
+    '''Return True if the index entry is out of date or doesn't
+    remember enough of the directory's biggest files.
+    '''
+    if entry is None or entry[0] != mtime:
+        return True
+    bigfiles, rest = entry[3], entry[4]
+    if rest < 0:
+        return False
+    if Threshold:
+        return rest >= Threshold*1e6
+    return len(bigfiles) < NumBigFiles
+
+def LoadIndex():
+    '''Return the directory entries of the size index.  An unreadable
+    index or one made with a different -a setting is ignored.
+    '''
+    try:
+        with open(IndexFile, "rb") as f:
+            index = pickle.load(f)
+        if (index.get("version") == IndexVersion and
+                index.get("allocated") == Allocated):
+            return index["dirs"]
+    except Exception:
+        pass
+    return {}
+
+def SaveIndex(entries):
+    '''Write the size index.  It's written to a temporary file first so
+    that an interrupted run can't leave a truncated index behind.
+    '''
+    index = {"version": IndexVersion, "allocated": Allocated,
+             "dirs": entries}
+    tmp = IndexFile + ".%d" % os.getpid()
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(IndexFile) and sys.platform == "win32":
+            os.remove(IndexFile)
+        os.rename(tmp, IndexFile)
+    except (IOError, OSError) as e:
+        err("Couldn't write index '%s':  %s" % (IndexFile, e) + nl)
+
+def IndexedWalkTree(directory, numprocs=1):
+    '''Same as WalkTree, but the sizes come from the index.  The tree
+    is traversed a level at a time; each directory is stat'ed and
+    only those whose mtime changed are read again (by a pool of
+    numprocs processes if numprocs > 1).  The subtree totals are
+    then aggregated from the index entries.
+    '''
+    entries = LoadIndex()
+    top = os.path.abspath(directory)
+    visited = []        # (absolute path, displayed path) in walk order
+    level = [(top, directory)]
+    pool = GetPool(numprocs) if numprocs > 1 else None
+    try:
+        while level:
+            current, stale = [], []
+            for path, name in level:
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISLNK(st.st_mode):
+                    continue    # Like os.walk, don't follow links
+                current.append((path, name))
+                if NeedsRescan(entries.get(path), st.st_mtime):
+                    stale.append(path)
+            scanned = (pool.map if pool else map)(ScanDirectory, stale)
+            for path, entry in zip(stale, scanned):
+                if entry is None:
+                    entries.pop(path, None)
+                else:
+                    entries[path] = entry
+            level = []
+            for path, name in current:
+                if path not in entries:
+                    continue
+                visited.append((path, name))
+                subdirs = entries[path][2]
+                Children[name] = [os.path.join(name, i) for i in subdirs]
+                level.extend(zip([os.path.join(path, i) for i in subdirs],
+                                 Children[name]))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    # Count each hard-linked file in the first directory it was seen
+    for path, name in visited:
+        mtime, size, subdirs, bigfiles, rest, linked = entries[path]
+        for size_, file in bigfiles:
+            KeepBigFile(size_, os.path.join(name, file))
+        for dev, ino, size_, file in linked:
+            if (dev, ino) not in Linked:
+                Linked[(dev, ino)] = (size_, name, os.path.join(name, file))
+                size += size_
+        OwnSizes[name] = size
+    # Children come after their parents in visited, so the subtree
+    # totals can be aggregated in reverse order.
+    for path, name in reversed(visited):
+        SubtreeSizes[name] = OwnSizes[name] + sum(
+            SubtreeSizes.get(i, 0) for i in Children[name])
+    # Forget the directories under top that no longer exist
+    seen = set(path for path, name in visited)
+    prefix = os.path.join(top, "")
+    for path in entries.keys():
+        if (path == top or path.startswith(prefix)) and path not in seen:
+            del entries[path]
+    SaveIndex(entries)
 
 def GetSize(directory, d):
     '''Returns a list of the form [ [a, b], [c, d], ... ] where
-    a, c, ... are the number of total bytes in the directory and
-    b, d, ... are the directory names.  The indicated directory 
-    is recursively descended and the results are sorted by directory 
+    a, c, ... are the number of bytes in the files of the directory
+    and b, d, ... are the directory names.  The indicated directory
+    is recursively descended and the results are sorted by directory
     size with the largest directory at the beginning of the list.
+
+    The same walk fills in SubtreeSizes and leaves BigFiles sorted in
+    increasing size.
     '''
     global DirSizes
-    DirSizes = []
-    os.path.walk(directory, GetTotalFileSize, "")
+    Reset()
+    if d.get("-i"):
+        IndexedWalkTree(directory, d.get("-j", 1))
+    elif d.get("-j", 1) > 1:
+        ParallelWalkTree(directory, d["-j"])
+    else:
+        WalkTree(directory)
+    # Each hard-linked file is now known once, so it can compete for
+    # a place in the biggest files.
+    for size, root, path in Linked.values():
+        KeepBigFile(size, path)
+    BigFiles.sort()
+    DirSizes = [[size, dir] for dir, size in OwnSizes.items()]
     DirSizes.sort()
     DirSizes.reverse()
     return DirSizes
 
 def ParseCommandLine(d):
+    d["-a"] = False     # Use allocated size
     d["-d"] = False     # Directories only
+    d["-i"] = False     # Use the size index
+    d["-j"] = 1         # Number of processes
     d["-n"] = 20        # Length of big files list
     d["-p"] = 1         # Percent threshold
     if len(sys.argv) < 2:
         Usage(d)
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "dhn:p:")
+        optlist, args = getopt.getopt(sys.argv[1:], "adhij:n:p:")
     except getopt.error as s:
         out(str(s) + nl)
         exit(1)
     for opt in optlist:
+        if opt[0] == "-a":
+            global Allocated
+            d["-a"] = Allocated = True
         if opt[0] == "-d":
             d["-d"] = True
+        if opt[0] == "-i":
+            d["-i"] = True
+        if opt[0] == "-j":
+            try:
+                d["-j"] = int(opt[1])
+                if d["-j"] < 1:
+                    raise ValueError()
+            except ValueError:
+                err("'%s' is not a valid number of processes" % opt[1] + nl)
+                exit(1)
         if opt[0] == "-n":
             global NumBigFiles
             NumBigFiles = int(opt[1])
@@ -157,16 +474,12 @@ def ParseCommandLine(d):
     return args
 
 def DirectoriesOnly(dir, d):
-    # Get list of directories under dir
-    from glob import glob
-    dirs = filter(os.path.isdir, glob(os.path.join(dir, "*")))
-    dirs += filter(os.path.isdir, glob(os.path.join(dir, ".*")))
-    Normalize(dirs)
+    # The subtree totals of the directories under dir come from a
+    # single walk of dir.
+    GetSize(dir, d)
     results = []
-    for dir in dirs:
-        sizes = GetSize(dir, d)
-        bytes = [x[0] for x in sizes]
-        results.append((sum(bytes)/1e6, dir))
+    for subdir in Children.get(dir, []):
+        results.append((SubtreeSizes.get(subdir, 0)/1e6, subdir.replace("\\", "/")))
     results.sort()
     results.reverse()
     out("Size, MB   Directory" + nl)
@@ -194,10 +507,8 @@ def NormalizeDecorated(dirs):
 def ShowBiggestDirectories(directory, d):
     GetSize(directory, d)
     # Get total number of bytes
-    total_size = 0L
+    total_size = SubtreeSizes.get(directory, 0L)
     NormalizeDecorated(DirSizes)
-    for dir in DirSizes:
-        total_size = total_size + dir[0]
     if total_size != 0:
         out("For directory '%s':    " % directory)
         out("[total space = %.1f MB]" % (total_size / 1e6) + nl)
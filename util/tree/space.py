@@ -0,0 +1 @@
+../space/space.py
\ No newline at end of file
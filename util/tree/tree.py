@@ -7,7 +7,9 @@ passed into the function.  The calling syntax is:
 
 The variable indent controls how much each subdirectory is indented
 on each line.  The variable leading_char sets the leading character
-in the list; '|' might not be a bad choice.
+in the list; '|' might not be a bad choice.  TreeLines() takes the
+same arguments and is a generator that yields the strings as the
+directory tree is walked.
 
 If you call the module as a script, it will print the tree to stdout
 for the directory you pass in on the command line (defaults to '.').
@@ -26,7 +28,15 @@ ANY KIND. See http://www.dspguru.com/wide-open-license for more
 information.
 '''
 
-import sys, os, os.path, re
+import sys, os, os.path, stat
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # Backport for python 2
+    except ImportError:
+        scandir = None
 
 d = {}  # Options dictionary
 
@@ -34,16 +44,15 @@ pyver = sys.version_info[0]
 if pyver == 3:
     raise RuntimeError("This script won't work under python 3")
 
-def GetSizesInMB(dirname, files):
-    size, error, scale = 0, False, 1e6
-    for file in files:
-        try:
-            s = os.stat(os.path.join(dirname, file))
-            size += s.st_size
-        except Exception:
-            error = True
+# If the -i option is used, this will hold the size of each directory's
+# files (or with -S, of the files at and below it) from space.py's
+# size index.
+IndexedSizes = None
+
+def GetSizesInMB(size, error):
+    scale = 1e6
     ratio = size/scale
-    if ratio >= d["-t"]:
+    if ratio >= d.get("-t", 0):
         s = ("%.2g" % ratio) + "M"
         if s[0] == "0":
             s = s[1:]
@@ -54,45 +63,105 @@ def GetSizesInMB(dirname, files):
         s = ""
     return s
 
-def visit(mydirlist, dirname, files):
-    # Append the directory name to the list mydirlist if appropriate
-    if d["-s"]:
-        # Decorate this directory with the sizes of its files in MB
-        dirname += GetSizesInMB(dirname, files)
-    if not (d["-m"] and "\\.hg" not in dirname):
-        return
-    else:
-        mydirlist.append(dirname.replace("\\", "/"))
+def ListDirectory(dirname, sizes=True):
+    '''Return a list of the subdirectory names of dirname sorted by name,
+    the total size of the other files in it and a flag that is True if
+    some entry couldn't be read.  Symbolic links to directories are
+    not followed.  If sizes is False, the files aren't stat'ed.
+    '''
+    dirs, size, error = [], 0, False
+    try:
+        if scandir is not None:
+            # The entry types usually come from the directory listing,
+            # so only the files need a stat call.
+            for entry in scandir(dirname):
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif sizes:
+                        st = entry.stat()
+                        if not stat.S_ISDIR(st.st_mode):
+                            size += st.st_size
+                except OSError:
+                    error = True
+        else:
+            for name in os.listdir(dirname):
+                path = os.path.join(dirname, name)
+                try:
+                    st = os.lstat(path)
+                    if stat.S_ISDIR(st.st_mode):
+                        dirs.append(name)
+                    elif sizes:
+                        if stat.S_ISLNK(st.st_mode):
+                            st = os.stat(path)
+                        if not stat.S_ISDIR(st.st_mode):
+                            size += st.st_size
+                except OSError:
+                    error = True
+    except OSError:
+        error = True
+    dirs.sort()
+    return dirs, size, error
 
-def Tree(dir, indent=4, leading_char="|"):
-    mydirlist = []
-    # walk calls visit with args (mydirlist, dirname, name) for each
-    # directory in the tree encountered at dir.  visit appends the
-    # directory name if not a Mercurial directory and decorates it
-    # with size in MB if appropriate.  mydirlist will return as a list of
-    # directories visited in depth-first order.
-    os.path.walk(dir, visit, mydirlist)
-    mydirlist.sort()
-    head = re.compile("^" + dir)
+def Walk(dirname, line, depth, indent_str, total):
+    '''Generator that yields the decorated line for dirname followed
+    by the lines for its subdirectories, which are indented by
+    indent_str.  The lines are produced as the tree is walked, so only
+    the directories on the current path are held in memory.
+
+    total is a list [size, error] that the size of the files at and
+    below dirname is added to.  With the -S option, a directory's line
+    must show the total of its subtree, so the lines below it are
+    held until its subtree has been walked.
+    '''
+    cumulative, show_size = d.get("-S"), d.get("-s") or d.get("-S")
+    dirs, size, error = ListDirectory(dirname, show_size and
+                                      IndexedSizes is None)
+    if IndexedSizes is not None:
+        size, error = IndexedSizes.get(dirname, 0), False
+    subtree = [size, error]
+    show = not d.get("-d") or depth <= d["-d"]
+    if show and not cumulative:
+        yield line + (GetSizesInMB(size, error) if show_size else "")
+    lines = []
+    if cumulative or not d.get("-d") or depth < d["-d"]:
+        for name in dirs:
+            if d.get("-m", True) and name == ".hg":
+                continue
+            path = os.path.join(dirname, name)
+            child = indent_str*(depth + 1) + name
+            for i in Walk(path, child, depth + 1, indent_str, subtree):
+                if cumulative:
+                    if show:
+                        lines.append(i)
+                else:
+                    yield i
+    if cumulative:
+        if IndexedSizes is not None:
+            subtree[0] = IndexedSizes.get(dirname, 0)
+        if show:
+            yield line + GetSizesInMB(*subtree)
+            for i in lines:
+                yield i
+    total[0] += subtree[0]
+    total[1] = total[1] or subtree[1]
+
+def TreeLines(dir, indent=4, leading_char="|"):
+    '''Generator form of Tree().
+    '''
+    global IndexedSizes
+    if (d.get("-s") or d.get("-S")) and d.get("-i"):
+        # Only the directories that changed since the last run need to
+        # be read to get the sizes.
+        import space
+        space.GetSize(dir, {"-i": True})
+        IndexedSizes = space.SubtreeSizes if d.get("-S") else space.OwnSizes
     indent_str = leading_char +  " " * (indent - 1)
-    # Decorate the directory list by indenting according to how many
-    # '/' characters are in the name.  Leave first entry alone because 
-    # it's the original directory we entered (i.e., the parameter
-    # dir).
-    decorations = []
-    for directory in mydirlist[1:]: 
-        if directory == ".":
-            continue
-        # Remove the leading dir string
-        normalized = head.sub("", directory)
-        # Split the directory path into components; we only want the
-        # last directory, as that's what gets decorated.
-        fields = normalized.split("/")
-        count = len(fields) - 1 if dir != "/" else len(fields)
-        name_to_decorate = fields[-1]
-        if name_to_decorate and (not d["-d"] or count <= d["-d"]):
-            decorations.append(indent_str*count + name_to_decorate)
-    return [dir] + decorations
+    for line in Walk(dir, dir, 0, indent_str, [0, False]):
+        yield line
+
+def Tree(dir, indent=4, leading_char="|"):
+    return list(TreeLines(dir, indent, leading_char))
 
 if __name__ == "__main__":
     import sys, getopt, functools
@@ -126,9 +195,15 @@ if __name__ == "__main__":
     -c x    Set the leading character for the trees.  Defaults to 
             '{char}'.
     -d n    Limit tree depth to n (default is to show all of tree).
+    -i      With -s, get the sizes from space.py's size index so that
+            only the directories that changed since the last run are
+            read.  Hard-linked files are only counted once.
     -m      Include Mercurial directories (.hg).
     -s      Decorate each directory with the size of its files in MB.
             The separation character is a tab.
+    -S      Decorate each directory with the size in MB of all the
+            files at and below it.  The lines under a directory are
+            printed after its subtree has been walked.
     -t n    Threshold size is n MB (default {size}).  Directories with
             a total size less than this won't have the size number printed.
 '''
@@ -139,13 +214,15 @@ if __name__ == "__main__":
         global d
         d["-c"] = "|"       # Leading character
         d["-d"] = 0         # Depth limit
+        d["-i"] = False     # Use space.py's size index
         d["-m"] = True      # Ignore Mercurial directories
         d["-s"] = False     # Decorate with size in MB
+        d["-S"] = False     # Decorate with cumulative size in MB
         d["-t"] = 0.1       # Threshold in MB for printing size
         if len(sys.argv) < 2:
             Usage()
         try:
-            optlist, args = getopt.getopt(sys.argv[1:], "c:d:hmst:")
+            optlist, args = getopt.getopt(sys.argv[1:], "c:d:himsSt:")
         except getopt.GetoptError as str:
             msg, option = str
             out(msg + nl)
@@ -157,10 +234,14 @@ if __name__ == "__main__":
                 d["-d"] = int(opt[1])
             if opt[0] == "-h":
                 Usage(0)
+            if opt[0] == "-i":
+                d["-i"] = True
             if opt[0] == "-m":
                 d["-m"] = False
             if opt[0] == "-s":
                 d["-s"] = True
+            if opt[0] == "-S":
+                d["-S"] = True
             if opt[0] == "-t":
                 try:
                     d["-t"] = float(opt[1])
@@ -175,7 +256,7 @@ if __name__ == "__main__":
         args = ParseCommandLine()
         char = d["-c"]
         for dir_to_process in args:
-            for dir in Tree(dir_to_process, leading_char=char):
+            for dir in TreeLines(dir_to_process, leading_char=char):
                 out(dir)
 
     main()
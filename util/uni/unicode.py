@@ -41,6 +41,12 @@ a few minutes to edit all the files).
 Set the global variables 'pdf_dir' and 'launch' to appropriate strings
 for your system.
 
+The parsed symbol index, the code point ranges of the PDF files and the
+locations of the code points in the text files are kept in the file
+named in 'index_file'.  Each part is rebuilt automatically when the
+file or directory it came from changes; you can delete the file at any
+time.
+
 On a UNIX system, you can do a 'man -k unicode' and you'll find some
 things that might be of interest.  For example, on my Linux box, I
 came across the gnome-character-map utility (charmap(1) that was
@@ -67,13 +73,25 @@ import os
 import re
 import sys
 import subprocess
+from array import array
+from bisect import bisect_right
 from pdb import set_trace as xx
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 # Global variables you'll need to set
 pdf_dir = "/doc/unicode"                # Where PDFs are located
 launch = "/usr/bin/exo-open"            # Program to launch a file
 datafile = "/doc/unicode/symbols.txt"   # Index text file
 
+# The parsed symbols, the PDF codepoint ranges and the locations of the
+# codepoints in the text files are kept in this file.  Each part is
+# rebuilt when the file or directory it came from changes.
+index_file = os.path.join(os.path.expanduser("~"), ".unicode_index")
+index_version = 1
+
 def Error(msg, status=1):
     print(msg, file=sys.stderr)
     exit(status)
@@ -122,8 +140,8 @@ def ParseCommandLine(d):
     d["-i"] = True      # Ignore case
     d["-n"] = False     # Sort by codepoint
     d["-t"] = False     # Search the *.txt file
-    data = open(datafile).read()
-    d["symbols"] = [i for i in data.split("\n") if i and i[0] != "#"]
+    d["index"] = LoadIndex()
+    d["symbols"], lower = GetSymbols(d["index"])
     try:
         opts, args = getopt.getopt(sys.argv[1:], "bdint")
     except getopt.GetoptError as e:
@@ -143,9 +161,115 @@ def ParseCommandLine(d):
     if not args:
         Usage(d)
     if d["-i"]:
-        d["symbols"] = [i.lower() for i in d["symbols"]]
+        d["symbols"] = lower
     return args
 
+def Stamp(path):
+    '''Return the (size, mtime) of path or None if it doesn't exist.
+    '''
+    try:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime)
+    except OSError:
+        return None
+
+def LoadIndex():
+    '''Return the index dictionary from the index file or an empty one
+    if it can't be read.  The "changed" key is True when it needs to
+    be written.
+    '''
+    try:
+        with open(index_file, "rb") as f:
+            index = pickle.load(f)
+        if index.get("version") != index_version:
+            raise ValueError("Old index")
+    except Exception:
+        index = {"version": index_version, "text": {}}
+    index["changed"] = False
+    return index
+
+def SaveIndex(index):
+    if not index["changed"]:
+        return
+    index["changed"] = False
+    tmp = index_file + ".%d" % os.getpid()
+    try:
+        with open(tmp, "wb") as f:
+            # Protocol 2 can be read by both python 2 and 3
+            pickle.dump(index, f, 2)
+        if sys.platform == "win32" and os.path.exists(index_file):
+            os.remove(index_file)
+        os.rename(tmp, index_file)
+    except (IOError, OSError) as e:
+        print("Couldn't write index '%s':  %s" % (index_file, e),
+              file=sys.stderr)
+
+def ToBytes(a):
+    return a.tobytes() if hasattr(a, "tobytes") else a.tostring()
+
+def FromBytes(typecode, b):
+    a = array(typecode)
+    if hasattr(a, "frombytes"):
+        a.frombytes(b)
+    else:
+        a.fromstring(b)
+    return a
+
+def GetSymbols(index):
+    '''Return (symbols, lower) where symbols is the list of lines in
+    the datafile and lower is the list of them in lower case.  The
+    word index for them is built if the datafile has changed.
+    '''
+    stamp = Stamp(datafile)
+    if stamp is None:
+        Error("Can't read '%s'" % datafile)
+    data = open(datafile).read()
+    symbols = [i for i in data.split("\n") if i and i[0] != "#"]
+    # Lowercasing doesn't change which lines are kept
+    lower = [i for i in data.lower().split("\n") if i and i[0] != "#"]
+    if index.get("words", (None,))[0] != stamp:
+        BuildWordIndex(lower, stamp, index)
+    return symbols, lower
+
+def BuildWordIndex(lower, stamp, index):
+    '''Make the inverted index of the words in the lines in lower.
+    The words are sorted and joined with newlines into one string;
+    word i starts at starts[i] and the numbers of the lines containing
+    it are postings[offsets[i]:offsets[i + 1]].  The arrays are stored
+    as strings so they load quickly.
+    '''
+    tokens, word = {}, re.compile(r"\w+")
+    for n, line in enumerate(lower):
+        for token in set(word.findall(line)):
+            tokens.setdefault(token, []).append(n)
+    words = sorted(tokens)
+    starts, offsets, postings = array("I"), array("I", [0]), array("I")
+    pos = 0
+    for token in words:
+        starts.append(pos)
+        pos += len(token) + 1
+        postings.extend(tokens[token])
+        offsets.append(len(postings))
+    starts.append(pos)
+    index["words"] = (stamp, "\n".join(words) + "\n", ToBytes(starts),
+                      ToBytes(offsets), ToBytes(postings))
+    index["changed"] = True
+
+def FindWord(word, d):
+    '''Return the sorted list of the numbers of the lines that contain
+    a word with word in it.
+    '''
+    stamp, words, starts, offsets, postings = d["index"]["words"]
+    starts, offsets, postings = [FromBytes("I", i) for i in
+                                 (starts, offsets, postings)]
+    lines, pos = set(), words.find(word)
+    while pos != -1:
+        i = bisect_right(starts, pos) - 1
+        lines.update(postings[offsets[i]:offsets[i + 1]])
+        # Go on to the next word
+        pos = words.find(word, starts[i + 1])
+    return sorted(lines)
+
 def IsHexNumber(regexp, d):
     chars = set(regexp.lower())
     digits, letters = "0123456789", "abcdef"
@@ -155,7 +279,40 @@ def IsHexNumber(regexp, d):
         return chars.issubset(set(digits + letters))
 
 def GetNumberRanges(d):
-    '''Read all the PDF files and return a list of tuple pairs
+    '''Return (ranges, starts, highs) where ranges is a list of the
+    (low, high, filename) tuples encoding the range of each PDF file
+    sorted by low, starts is the list of the lows and highs[i] is the
+    largest high in ranges[:i + 1].  They come from the index unless
+    pdf_dir has changed.
+    '''
+    index, stamp = d["index"], Stamp(pdf_dir)
+    if index.get("ranges", (None,))[0] != stamp:
+        ranges = sorted(ReadNumberRanges())
+        starts = [i[0] for i in ranges]
+        highs, high = [], -1
+        for low, hi, filename in ranges:
+            high = max(high, hi)
+            highs.append(high)
+        index["ranges"] = (stamp, ranges, starts, highs)
+        index["changed"] = True
+    return index["ranges"][1:]
+
+def FindFile(u, d):
+    '''Return the name of the PDF file whose range contains the
+    codepoint u or None if there isn't one.
+    '''
+    ranges, starts, highs = GetNumberRanges(d)
+    i = bisect_right(starts, u) - 1
+    # Ranges can overlap, so look back while one could contain u
+    while i >= 0 and highs[i] >= u:
+        low, high, filename = ranges[i]
+        if u <= high:
+            return filename
+        i -= 1
+    return None
+
+def ReadNumberRanges():
+    '''Read all the PDF file names and return a list of tuples
     encoding their range.
     '''
     ranges = []
@@ -190,52 +347,84 @@ def Normalize(num):
         s = "0" + s
     return s.upper()
 
+def GetTextOffsets(textfile, d):
+    '''Return a dictionary keyed by the codepoint strings that begin
+    lines in textfile after its second formfeed character.  The values
+    are the (start, end) byte offsets of the text for the codepoint:
+    from its first line to the next line beginning with a different
+    codepoint (end is None for the last one).  They come from the
+    index unless textfile has changed.
+    '''
+    index, stamp = d["index"], Stamp(textfile)
+    entry = index["text"].get(textfile)
+    if entry is not None and entry[0] == stamp:
+        return pickle.loads(entry[1])
+    data = open(textfile, "rb").read()
+    # Skip the text up to the second formfeed character
+    pos = 0
+    for i in range(1, 3):
+        loc = data.find(b"\x0c", pos)
+        if loc == -1:
+            Error("'%s' missing formfeed number %d" % (textfile, i))
+        pos = loc + 1
+    offsets, current = {}, None
+    r = re.compile(br"[0-9a-fA-F]{4,5}")
+    while pos < len(data):
+        mo = r.match(data, pos)
+        if mo:
+            codepoint = mo.group().decode("ascii")
+            if codepoint != current:
+                if current is not None and offsets[current][1] is None:
+                    offsets[current] = (offsets[current][0], pos)
+                if codepoint not in offsets:
+                    offsets[codepoint] = (pos, None)
+                current = codepoint
+        loc = data.find(b"\n", pos)
+        pos = len(data) if loc == -1 else loc + 1
+    # Pickled on their own so they're only unpickled when needed
+    index["text"][textfile] = (stamp, pickle.dumps(offsets, 2))
+    index["changed"] = True
+    return offsets
+
 def OpenTextFile(num, filename, d):
     '''filename is the name of a PDF file.  num is the codepoint to
-    search for.  Open the text file, search down to the first form
-    feed, then start searching for a line that begins with that
-    codepoint number.  Continue to print lines until the next
-    codepoint line is reached.
+    search for.  Print the lines of the text file that go with the PDF
+    from the line that begins with that codepoint number up to the next
+    codepoint line.  The text file's codepoint offsets let us read just
+    those lines.
     '''
     # Get the text from the text file corresponding to the PDF
     name, ext = os.path.splitext(filename)
     textfile = name + ".txt"
     if not os.path.isfile(textfile):
         Error("Could not find '%s'" % textfile)
-    text = open(textfile, "rb").read().decode("UTF-8")
-    # Keep only the text after the second formfeed character
-    for i in range(1, 3):
-        loc = text.find(chr(0x0c))
-        if loc == -1:
-            Error("'%s' missing formfeed number %d" % (textfile, i))
-        text = text[loc + 1:]
-    # Now split on newlines
-    lines = text.split("\n")
-    # Search down until regexp is found
-    codepoint, show = Normalize(int(num, 16)), False
-    r = re.compile(r"^[0-9a-f]{4,5}", re.I)
+    codepoint = Normalize(int(num, 16))
+    location = GetTextOffsets(textfile, d).get(codepoint)
+    if location is None:
+        return
+    start, end = location
+    with open(textfile, "rb") as f:
+        f.seek(start)
+        text = f.read() if end is None else f.read(end - start)
+    lines = text.decode("UTF-8").split("\n")
+    if end is not None:
+        del lines[-1]   # Empty string after the last newline
     for line in lines:
-        if line.startswith(codepoint):
-            show = True
-        else:
-            mo = r.search(line)
-            if show and mo:
-                break  # Found next codepoint's line
-        if show:
-            print(line)
+        print(line)
 
 def OpenPDF(regexp, d):
     ''''''
     u = int(regexp, 16)
-    ranges = GetNumberRanges(d)
-    for low, high, filename in ranges:
-         if low <= u <= high:
-            if d["-t"]:
-                # Open the text file instead
-                rc = OpenTextFile(regexp, filename, d)
-            else:
-                rc = subprocess.call("%s %s" % (launch, filename), shell=True)
-            exit(rc)
+    filename = FindFile(u, d)
+    if filename is not None:
+        if d["-t"]:
+            # Open the text file instead
+            rc = OpenTextFile(regexp, filename, d)
+        else:
+            rc = subprocess.call("%s %s" % (launch, filename), shell=True)
+        SaveIndex(d["index"])
+        exit(rc)
+    SaveIndex(d["index"])
     print("No appropriate file found for %s" % regexp)
     exit(1)
 
@@ -271,7 +460,14 @@ def Search(regexp, d):
         OpenPDF(regexp, d)
         return
     r, results = re.compile(regexp), []
-    for line in d["symbols"]:
+    if re.match(r"^\w+$", regexp):
+        # A plain word can only be found in the lines with a word that
+        # contains it, so only those lines need to be searched.
+        lines = FindWord(regexp.lower(), d)
+        candidates = [d["symbols"][i] for i in lines]
+    else:
+        candidates = d["symbols"]
+    for line in candidates:
         mo = r.search(line)
         if mo:
             # Store with codepoint so can be sorted if desired
@@ -287,5 +483,6 @@ def main():
     regexps = ParseCommandLine(d)
     for regexp in regexps:
         Search(regexp, d)
+    SaveIndex(d["index"])
 
 main()